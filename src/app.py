@@ -6,7 +6,17 @@ Phase 12: Gradio web interface with structured artifacts UI.
 - Tabbed artifacts panel on the right (Data, Chart, Details)
 """
 
+import asyncio
+import atexit
+import functools
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
 import gradio as gr
+import httpx
 from langchain_openai import AzureChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from langfuse.callback import CallbackHandler
@@ -22,71 +32,176 @@ from main import create_multi_agent_system
 
 load_dotenv()
 
+# Queue sizing: how many chat turns may run concurrently (each turn is an
+# LLM + SQL round-trip, so the default of 1 would serialize all users)
+CHAT_CONCURRENCY_LIMIT = int(os.getenv("GRADIO_DEFAULT_CONCURRENCY_LIMIT", "8"))
+QUEUE_MAX_SIZE = int(os.getenv("GRADIO_QUEUE_MAX_SIZE", "64"))
+
 # Global state for the agent
 agent_system = None
 schema_info = ""
 sample_data_info = ""
 langfuse_handler = None
 
-
-def initialize_agent():
-    """Initialize the multi-agent system."""
-    global agent_system, schema_info, sample_data_info, langfuse_handler
-
-    # Load schema
-    try:
-        schema_info = db.get_table_schema()
-        table_names = db.get_table_names()
-        sample_data_parts = []
-        for table_name in table_names:
-            sample_data = db.get_sample_data(table_name, limit=2)
-            sample_data_parts.append(sample_data)
-        sample_data_info = "\n".join(sample_data_parts)
-    except Exception as e:
-        print(f"Warning: Could not load schema: {e}")
-        schema_info = "Schema unavailable"
-        sample_data_info = ""
-
-    # Initialize LLM
-    llm = AzureChatOpenAI(
-        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-        azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT"],
-        api_version="2024-02-01",
+# Singleton invoke config, built once at init: None when tracing is off,
+# a shared callbacks dict otherwise - avoids a per-turn dict allocation
+# and branch in chat()
+_invoke_config = None
+
+# Guards initialize_agent against concurrent/repeated initialization
+# (dev reload loops, multiple importers)
+_init_lock = threading.Lock()
+
+# Shared HTTP transport for all LLM calls: keep-alive connections (and
+# HTTP/2 multiplexing when the h2 package is present) avoid paying a
+# TCP+TLS handshake per chat turn
+try:
+    import h2  # noqa: F401  (presence check only)
+
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+_HTTPX_LIMITS = httpx.Limits(
+    max_keepalive_connections=32, max_connections=64, keepalive_expiry=300.0
+)
+_HTTPX_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+_HTTPX_ASYNC = httpx.AsyncClient(http2=_HTTP2, limits=_HTTPX_LIMITS, timeout=_HTTPX_TIMEOUT)
+_HTTPX_SYNC = httpx.Client(http2=_HTTP2, limits=_HTTPX_LIMITS, timeout=_HTTPX_TIMEOUT)
+atexit.register(_HTTPX_SYNC.close)
+
+# Response cache: repeated questions (same normalized text, same recent
+# context) skip the whole LLM+SQL round-trip. Bounded LRU; entries with
+# time-sensitive wording are never cached.
+_RESPONSE_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_RESPONSE_CACHE_MAX = 256
+_TIME_SENSITIVE_RE = re.compile(
+    r"\b(today|now|current|yesterday|this (?:hour|minute|week|month|year)|last hour)\b"
+)
+
+
+def _response_cache_key(message: str, history: list) -> tuple | None:
+    """Build a cache key for a chat turn, or None if the turn is uncacheable."""
+    normalized = " ".join(message.lower().split())
+    if _TIME_SENSITIVE_RE.search(normalized):
+        return None
+    tail = json.dumps(history[-4:], sort_keys=True, default=str)
+    return (normalized, hashlib.sha1(tail.encode()).hexdigest())
+
+
+# Template for the per-turn graph input state; copied per turn instead of
+# re-spelling the 14-key dict literal on every invocation
+_BASE_STATE = {
+    "user_question": "",
+    "needs_sql": False,
+    "needs_viz": False,
+    "speculative_sql": None,
+    "sql_query": None,
+    "sql_results": None,
+    "sql_results_parsed": None,
+    "chart_type": None,
+    "chart_path": None,
+    "final_response": None,
+    "error": None,
+    # Artifact fields
+    "table_columns": None,
+    "table_rows": None,
+    "row_count": None,
+    "show_table": False,
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _load_schema_context() -> tuple[str, str]:
+    """Load schema and sample data once per process (cached)."""
+    schema, sample_data, _table_count = db.load_schema_context(sample_limit=2)
+    return schema, sample_data
+
+
+@functools.lru_cache(maxsize=1)
+def _get_llm(endpoint: str, deployment: str, api_version: str) -> AzureChatOpenAI:
+    """Build the Azure OpenAI client once per (endpoint, deployment) config."""
+    return AzureChatOpenAI(
+        azure_endpoint=endpoint,
+        azure_deployment=deployment,
+        api_version=api_version,
         api_key=os.environ["AZURE_OPENAI_API_KEY"],
         temperature=0,
+        http_client=_HTTPX_SYNC,
+        http_async_client=_HTTPX_ASYNC,
     )
 
-    # Create agent
-    agent_system = create_multi_agent_system(llm, schema_info, sample_data_info)
 
-    # Initialize Langfuse callback (optional)
-    if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
-        try:
-            session_id = f"gradio-{uuid.uuid4().hex[:8]}"
-            langfuse_handler = CallbackHandler(
-                public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-                secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-                host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com"),
-                session_id=session_id,
-                user_id="gradio-user",
-                metadata={"interface": "gradio"},
-            )
-            print(f"✓ Langfuse tracing enabled (session: {session_id})")
-        except Exception as e:
-            print(f"⚠ Langfuse initialization failed: {e}")
-
-    print("Agent initialized successfully!")
+def initialize_agent():
+    """Initialize the multi-agent system (idempotent, thread-safe)."""
+    global agent_system, schema_info, sample_data_info, langfuse_handler, _invoke_config
 
+    with _init_lock:
+        if agent_system is not None:
+            return
 
-def chat(message: str, history: list) -> tuple:
-    """Process a chat message and return updated history with artifacts.
+        # Load schema (cached across re-initialization)
+        try:
+            schema_info, sample_data_info = _load_schema_context()
+        except Exception as e:
+            print(f"Warning: Could not load schema: {e}")
+            schema_info = "Schema unavailable"
+            sample_data_info = ""
+
+        # Initialize LLM (singleton per endpoint/deployment config)
+        llm = _get_llm(
+            os.environ["AZURE_OPENAI_ENDPOINT"],
+            os.environ["AZURE_OPENAI_DEPLOYMENT"],
+            "2024-02-01",
+        )
+
+        # Create agent. The web UI keeps its own per-session history in
+        # gr.State and passes no thread_id, so the optional CLI
+        # checkpointer must stay off here (langgraph requires a
+        # thread_id whenever a checkpointer is attached).
+        agent_system = create_multi_agent_system(
+            llm, schema_info, sample_data_info, use_checkpointer=False
+        )
+
+        # Initialize Langfuse callback (optional)
+        if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
+            try:
+                session_id = f"gradio-{uuid.uuid4().hex[:8]}"
+                langfuse_handler = CallbackHandler(
+                    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
+                    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
+                    host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com"),
+                    session_id=session_id,
+                    user_id="gradio-user",
+                    metadata={"interface": "gradio"},
+                    # Batch telemetry in the background so a slow Langfuse
+                    # endpoint never stalls a chat turn
+                    flush_at=20,
+                    flush_interval=5.0,
+                )
+                # Don't lose buffered events on shutdown
+                atexit.register(langfuse_handler.flush)
+                _invoke_config = {"callbacks": [langfuse_handler]}
+                print(f"✓ Langfuse tracing enabled (session: {session_id})")
+            except Exception as e:
+                print(f"⚠ Langfuse initialization failed: {e}")
+
+        print("Agent initialized successfully!")
+
+
+async def chat(message: str, history: list, messages: list[BaseMessage]):
+    """Process a chat message, streaming partial history as tokens arrive.
+
+    Async generator: yields (history, table_data, chart_path, sql_code,
+    details_info, csv_path) tuples. Intermediate yields carry the partial
+    assistant message (for real-time SSE updates); the final yield carries
+    the complete response plus all artifacts.
 
     Args:
         message: User's message
         history: Chat history (list of message dicts with 'role' and 'content')
-
-    Returns:
-        Tuple of (history, table_data, chart_path, sql_code, details_info, csv_path)
+        messages: Cached LangChain message list (kept in gr.State so the
+            conversation isn't re-converted from history every turn)
     """
     global agent_system
 
@@ -95,46 +210,73 @@ def chat(message: str, history: list) -> tuple:
 
     if agent_system is None:
         history.append({"role": "assistant", "content": "Error: Agent not initialized."})
-        return (history, empty_table, None, "", "", None)
-
-    # Build LangChain messages from history
-    messages: list[BaseMessage] = []
-    for msg in history:
-        if msg["role"] == "user":
-            messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            messages.append(AIMessage(content=msg["content"]))
-
-    # Add current message
+        yield (history, empty_table, None, "", "", None)
+        return
+
+    # Serve repeated questions straight from the response cache
+    cache_key = _response_cache_key(message, history)
+    if cache_key is not None and cache_key in _RESPONSE_CACHE:
+        _RESPONSE_CACHE.move_to_end(cache_key)
+        response, table_data, chart_path, sql_query, details_info, csv_path = (
+            _RESPONSE_CACHE[cache_key]
+        )
+        if not chart_path or os.path.exists(chart_path):
+            # Gradio auto-cleans gr.File temp files, so the cached CSV
+            # may be gone even when the entry is otherwise fresh;
+            # rebuild it from the cached table data instead of handing
+            # the download component a dead path
+            if csv_path and not os.path.exists(csv_path):
+                csv_path = artifacts.table_to_csv_tempfile(
+                    table_data.get("headers", []), table_data.get("data", [])
+                )
+                _RESPONSE_CACHE[cache_key] = (
+                    response, table_data, chart_path, sql_query, details_info, csv_path
+                )
+            messages.append(HumanMessage(content=message))
+            messages.append(AIMessage(content=response))
+            history.append({"role": "user", "content": message})
+            history.append({"role": "assistant", "content": response})
+            yield (history, table_data, chart_path, sql_query, details_info, csv_path)
+            return
+        # Chart temp file was cleaned up - drop the stale entry
+        del _RESPONSE_CACHE[cache_key]
+
+    # Add current message (prior turns are already in the cached list)
     messages.append(HumanMessage(content=message))
 
+    # Show the user message (and a pending assistant slot) immediately
+    history.append({"role": "user", "content": message})
+    history.append({"role": "assistant", "content": ""})
+
     try:
-        # Build config with optional Langfuse callback
-        config = {}
-        if langfuse_handler:
-            config["callbacks"] = [langfuse_handler]
-
-        # Run the multi-agent system
-        result = agent_system.invoke({
-            "messages": messages,
-            "user_question": "",
-            "needs_sql": False,
-            "needs_viz": False,
-            "sql_query": None,
-            "sql_results": None,
-            "chart_type": None,
-            "chart_path": None,
-            "final_response": None,
-            "error": None,
-            # Artifact fields
-            "table_columns": None,
-            "table_rows": None,
-            "row_count": None,
-            "show_table": False,
-        }, config=config if config else None)
+        # Stream the multi-agent system so the user sees tokens as the
+        # response agent generates them, instead of waiting for the full
+        # graph to finish
+        result = None
+        partial_response = ""
+        state = _BASE_STATE.copy()
+        state["messages"] = messages
+        async for ev in agent_system.astream_events(
+            state, version="v2", config=_invoke_config
+        ):
+            if (
+                ev["event"] == "on_chat_model_stream"
+                and ev.get("metadata", {}).get("langgraph_node") == "response_agent"
+            ):
+                chunk_content = ev["data"]["chunk"].content
+                if chunk_content:
+                    partial_response += chunk_content
+                    history[-1]["content"] = partial_response
+                    yield (history, empty_table, None, "", "", None)
+            elif ev["event"] == "on_chain_end" and not ev.get("parent_ids"):
+                # Top-level graph finished - capture the final state
+                result = ev["data"]["output"]
+
+        if result is None:
+            result = {}
 
         # Extract results
-        response = result.get("final_response", "No response generated.")
+        response = result.get("final_response") or partial_response or "No response generated."
         chart_path = result.get("chart_path")
         sql_query = result.get("sql_query") or ""
         table_columns = result.get("table_columns") or []
@@ -142,9 +284,9 @@ def chat(message: str, history: list) -> tuple:
         row_count = result.get("row_count") or 0
         show_table = result.get("show_table", False)
 
-        # Update history with new messages
-        history.append({"role": "user", "content": message})
-        history.append({"role": "assistant", "content": response})
+        # Finalize the streamed assistant message and the cached messages
+        history[-1]["content"] = response
+        messages.append(AIMessage(content=response))
 
         # Prepare table data for gr.Dataframe
         if table_columns and table_rows:
@@ -163,120 +305,145 @@ def chat(message: str, history: list) -> tuple:
             details_parts.append("**Table visible:** Yes")
         details_info = "\n\n".join(details_parts)
 
-        # Create CSV temp file for download
+        # Create CSV temp file for download (disk I/O off the event loop)
         csv_path = None
         if table_columns and table_rows:
-            csv_path = artifacts.table_to_csv_tempfile(table_columns, table_rows)
+            csv_path = await asyncio.to_thread(
+                artifacts.table_to_csv_tempfile, table_columns, table_rows
+            )
+
+        # Populate the response cache for identical follow-up questions
+        if cache_key is not None and not result.get("error"):
+            _RESPONSE_CACHE[cache_key] = (
+                response, table_data, chart_path, sql_query, details_info, csv_path
+            )
+            while len(_RESPONSE_CACHE) > _RESPONSE_CACHE_MAX:
+                _RESPONSE_CACHE.popitem(last=False)
 
-        return (history, table_data, chart_path, sql_query, details_info, csv_path)
+        yield (history, table_data, chart_path, sql_query, details_info, csv_path)
 
     except Exception as e:
-        history.append({"role": "user", "content": message})
-        history.append({"role": "assistant", "content": f"Error: {str(e)}"})
-        return (history, empty_table, None, "", f"**Error:** {str(e)}", None)
-
-
-# Create Gradio interface
-with gr.Blocks(title="Finance Assistant") as demo:
-    gr.Markdown(
-        """
-        # Finance Assistant
-
-        Ask questions about your financial transactions. I can:
-        - Query your transaction data
-        - Generate visualizations (charts)
-        - Provide insights and summaries
-
-        **Examples:**
-        - "What's my total spending?"
-        - "Show my expenses by category"
-        - "List last 10 transactions"
-        """
-    )
+        history[-1]["content"] = f"Error: {str(e)}"
+        # Keep the cached messages in sync with the visible history
+        messages.append(AIMessage(content=f"Error: {str(e)}"))
+        yield (history, empty_table, None, "", f"**Error:** {str(e)}", None)
 
-    with gr.Row():
-        # Left column: Chat
-        with gr.Column(scale=2):
-            chatbot = gr.Chatbot(
-                label="Chat",
-                height=450,
-            )
-            msg = gr.Textbox(
-                label="Your question",
-                placeholder="Ask about your transactions...",
-                lines=1,
-            )
-            with gr.Row():
-                submit_btn = gr.Button("Send", variant="primary")
-                clear_btn = gr.Button("Clear")
-
-        # Right column: Tabbed artifacts
-        with gr.Column(scale=1):
-            with gr.Tabs():
-                with gr.TabItem("Data"):
-                    data_table = gr.Dataframe(
-                        label="Query Results",
-                        interactive=False,
-                        wrap=True,
-                    )
-                    csv_download = gr.File(
-                        label="Download CSV",
-                        visible=True,
-                    )
-
-                with gr.TabItem("Chart"):
-                    chart_output = gr.Image(
-                        label="Visualization",
-                        height=400,
-                    )
-
-                with gr.TabItem("Details"):
-                    sql_code = gr.Code(
-                        label="SQL Query",
-                        language="sql",
-                        lines=8,
-                    )
-                    details_info = gr.Markdown(
-                        label="Info",
-                        value="",
-                    )
-
-    def user_submit(user_message, history):
-        """Handle user message submission."""
-        if not user_message.strip():
-            # Return current state unchanged
-            empty_table = {"headers": [], "data": []}
-            return "", history, empty_table, None, "", "", None
 
-        # Get response with all artifacts
-        result = chat(user_message, history)
-        updated_history, table_data, chart_path, sql_query, details, csv_path = result
+def build_demo() -> gr.Blocks:
+    """Build the Gradio interface.
 
-        return "", updated_history, table_data, chart_path, sql_query, details, csv_path
+    Constructed lazily so importing this module (tests, workers,
+    hot-reload) doesn't pay for UI construction.
+    """
+    with gr.Blocks(title="Finance Assistant") as demo:
+        gr.Markdown(
+            """
+            # Finance Assistant
+
+            Ask questions about your financial transactions. I can:
+            - Query your transaction data
+            - Generate visualizations (charts)
+            - Provide insights and summaries
+
+            **Examples:**
+            - "What's my total spending?"
+            - "Show my expenses by category"
+            - "List last 10 transactions"
+            """
+        )
+
+        # Cached LangChain message list; avoids rebuilding Human/AI message
+        # objects from the full history on every turn
+        msg_state = gr.State([])
+
+        with gr.Row():
+            # Left column: Chat
+            with gr.Column(scale=2):
+                chatbot = gr.Chatbot(
+                    label="Chat",
+                    height=450,
+                )
+                msg = gr.Textbox(
+                    label="Your question",
+                    placeholder="Ask about your transactions...",
+                    lines=1,
+                )
+                with gr.Row():
+                    submit_btn = gr.Button("Send", variant="primary")
+                    clear_btn = gr.Button("Clear")
+
+            # Right column: Tabbed artifacts
+            with gr.Column(scale=1):
+                with gr.Tabs():
+                    with gr.TabItem("Data"):
+                        data_table = gr.Dataframe(
+                            label="Query Results",
+                            interactive=False,
+                            wrap=True,
+                        )
+                        csv_download = gr.File(
+                            label="Download CSV",
+                            visible=True,
+                        )
+
+                    with gr.TabItem("Chart"):
+                        chart_output = gr.Image(
+                            label="Visualization",
+                            height=400,
+                        )
+
+                    with gr.TabItem("Details"):
+                        sql_code = gr.Code(
+                            label="SQL Query",
+                            language="sql",
+                            lines=8,
+                        )
+                        details_info = gr.Markdown(
+                            label="Info",
+                            value="",
+                        )
+
+        async def user_submit(user_message, history, messages):
+            """Handle user message submission."""
+            if not user_message.strip():
+                # Return current state unchanged
+                empty_table = {"headers": [], "data": []}
+                yield "", history, messages, empty_table, None, "", "", None
+                return
+
+            # Stream responses with all artifacts; Gradio pushes each yield
+            # to the browser as an SSE update
+            async for result in chat(user_message, history, messages):
+                updated_history, table_data, chart_path, sql_query, details, csv_path = result
+                yield "", updated_history, messages, table_data, chart_path, sql_query, details, csv_path
+
+        def clear_all():
+            """Clear all outputs."""
+            empty_table = {"headers": [], "data": []}
+            return [], [], empty_table, None, "", "", None
 
-    def clear_all():
-        """Clear all outputs."""
-        empty_table = {"headers": [], "data": []}
-        return [], empty_table, None, "", "", None
+        # Connect events
+        msg.submit(
+            user_submit,
+            inputs=[msg, chatbot, msg_state],
+            outputs=[msg, chatbot, msg_state, data_table, chart_output, sql_code, details_info, csv_download],
+            concurrency_limit=CHAT_CONCURRENCY_LIMIT,
+        )
 
-    # Connect events
-    msg.submit(
-        user_submit,
-        inputs=[msg, chatbot],
-        outputs=[msg, chatbot, data_table, chart_output, sql_code, details_info, csv_download],
-    )
+        submit_btn.click(
+            user_submit,
+            inputs=[msg, chatbot, msg_state],
+            outputs=[msg, chatbot, msg_state, data_table, chart_output, sql_code, details_info, csv_download],
+            concurrency_limit=CHAT_CONCURRENCY_LIMIT,
+        )
 
-    submit_btn.click(
-        user_submit,
-        inputs=[msg, chatbot],
-        outputs=[msg, chatbot, data_table, chart_output, sql_code, details_info, csv_download],
-    )
+        clear_btn.click(
+            clear_all,
+            outputs=[chatbot, msg_state, data_table, chart_output, sql_code, details_info, csv_download],
+        )
 
-    clear_btn.click(
-        clear_all,
-        outputs=[chatbot, data_table, chart_output, sql_code, details_info, csv_download],
-    )
 
+    return demo
 
 def main():
     """Launch the Gradio web interface."""
@@ -287,6 +454,17 @@ def main():
 
     initialize_agent()
 
+    demo = build_demo()
+
+    # Enable the SSE queue so independent user turns run concurrently
+    # instead of waiting behind each other's agent invocation; close the
+    # auto-generated API page to skip schema introspection per connection
+    demo.queue(
+        default_concurrency_limit=CHAT_CONCURRENCY_LIMIT,
+        max_size=QUEUE_MAX_SIZE,
+        api_open=False,
+    )
+
     # Get authentication credentials from environment
     auth_user = os.getenv("GRADIO_AUTH_USER")
     auth_pass = os.getenv("GRADIO_AUTH_PASS")
@@ -305,6 +483,10 @@ def main():
         server_port=7860,
         share=False,
         auth=auth,
+        # Bound the worker pool explicitly: chat turns hold threads for
+        # seconds, so size it for expected concurrency instead of the
+        # lazily-grown default
+        max_threads=int(os.getenv("GRADIO_MAX_THREADS", "32")),
     )
 
 
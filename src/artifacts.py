@@ -4,11 +4,41 @@ from __future__ import annotations
 
 import base64
 import csv
+import hashlib
+import io
 import json
+import operator
+import os
 import tempfile
 import uuid
+from collections import OrderedDict
 from typing import TypedDict
 
+try:
+    # C-accelerated JSON parsing for large SQL result payloads; the stdlib
+    # fallback keeps the module usable in environments without orjson
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj, default=str)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, default=str).encode()
+
+try:
+    # SIMD-accelerated base64 for chart PNGs (hundreds of KB); optional
+    import pybase64
+
+    _b64encode = pybase64.b64encode
+    _b64decode = pybase64.b64decode
+except ImportError:
+    _b64encode = base64.b64encode
+    _b64decode = base64.b64decode
+
 
 # --- Artifact Type Definitions ---
 
@@ -52,19 +82,62 @@ Artifact = TableArtifact | ChartArtifact | DetailsArtifact | ErrorArtifact
 # Maximum rows to include in table artifact (UI safety)
 MAX_TABLE_ROWS = 50
 
+# Above this payload size, parse the results array incrementally instead
+# of materializing every row (only MAX_TABLE_ROWS are ever kept).
+# Public so callers can make the same eager-vs-capped parse decision.
+STREAM_PARSE_THRESHOLD = 1_000_000
+
+
+def _parse_rows_capped(payload: str) -> tuple[list, int]:
+    """
+    Incrementally parse a JSON array of rows, keeping at most MAX_TABLE_ROWS.
+
+    Bounds memory to O(MAX_TABLE_ROWS) for pathological result sets (e.g.
+    an accidental huge SELECT) while still counting the total rows.
+
+    Args:
+        payload: JSON string starting with '['
+
+    Returns:
+        Tuple of (first rows, total row count)
+
+    Raises:
+        ValueError: If the payload is not a valid JSON array
+    """
+    decoder = json.JSONDecoder()
+    idx = payload.index("[") + 1
+    n = len(payload)
+    rows: list = []
+    count = 0
+
+    while True:
+        while idx < n and payload[idx] in " \t\r\n,":
+            idx += 1
+        if idx >= n:
+            raise ValueError("Unterminated JSON array")
+        if payload[idx] == "]":
+            break
+        obj, idx = decoder.raw_decode(payload, idx)
+        count += 1
+        if count <= MAX_TABLE_ROWS:
+            rows.append(obj)
+
+    return rows, count
+
 
 # --- Helper Functions ---
 
 
 def results_json_to_table(
-    sql_results_json: str,
+    sql_results_json: str | list | dict,
 ) -> tuple[list[str], list[list], int] | ErrorArtifact:
     """
     Parse SQL results JSON into table components.
 
     Args:
-        sql_results_json: JSON string from db.execute_sql_query().
-            Can be:
+        sql_results_json: JSON string from db.execute_sql_query(), or the
+            already-parsed object when the caller has decoded it (avoids
+            a duplicate parse). Either way the payload can be:
             - A list of dicts: [{"col1": val1, "col2": val2}, ...]
             - An error object: {"error": "...", "query": "...", "attempts": N}
 
@@ -78,13 +151,31 @@ def results_json_to_table(
     if not sql_results_json:
         return [], [], 0
 
-    try:
-        data = json.loads(sql_results_json)
-    except json.JSONDecodeError as e:
-        return ErrorArtifact(
-            type="error",
-            message=f"Failed to parse SQL results: {e}",
-        )
+    # Oversized array payloads: stream-parse and keep only the rows we
+    # will display, instead of materializing the full list
+    total_rows = None
+    if not isinstance(sql_results_json, str):
+        data = sql_results_json
+    elif (
+        len(sql_results_json) > STREAM_PARSE_THRESHOLD
+        and sql_results_json.lstrip().startswith("[")
+    ):
+        try:
+            data, total_rows = _parse_rows_capped(sql_results_json)
+        except ValueError as e:
+            return ErrorArtifact(
+                type="error",
+                message=f"Failed to parse SQL results: {e}",
+            )
+    else:
+        try:
+            data = _json_loads(sql_results_json)
+        except ValueError as e:
+            # Covers both json.JSONDecodeError and orjson.JSONDecodeError
+            return ErrorArtifact(
+                type="error",
+                message=f"Failed to parse SQL results: {e}",
+            )
 
     # Check for error response
     if isinstance(data, dict):
@@ -116,21 +207,41 @@ def results_json_to_table(
         )
 
     columns = list(first_row.keys())
-    row_count = len(data)
+    row_count = total_rows if total_rows is not None else len(data)
 
-    # Convert dicts to lists of values, respecting column order
-    rows = []
-    for row_dict in data[:MAX_TABLE_ROWS]:
-        row_values = [row_dict.get(col) for col in columns]
-        rows.append(row_values)
+    # Convert dicts to lists of values, respecting column order.
+    # itemgetter does the per-row extraction in a single C call instead of
+    # a Python-level dict lookup per cell.
+    getter = operator.itemgetter(*columns)
+    try:
+        if len(columns) == 1:
+            rows = [[getter(row_dict)] for row_dict in data[:MAX_TABLE_ROWS]]
+        else:
+            rows = [list(getter(row_dict)) for row_dict in data[:MAX_TABLE_ROWS]]
+    except KeyError:
+        # Ragged rows (a key missing in some row): fall back to .get
+        rows = [
+            [row_dict.get(col) for col in columns]
+            for row_dict in data[:MAX_TABLE_ROWS]
+        ]
 
     return columns, rows, row_count
 
 
+# Content-hash cache of already-written CSV exports: identical result sets
+# (same question re-asked, repeated turns) reuse the existing temp file
+# instead of paying disk I/O again. Bounded to keep memory flat.
+_CSV_CACHE: OrderedDict[str, str] = OrderedDict()
+_CSV_CACHE_MAX = 32
+
+
 def table_to_csv_tempfile(columns: list[str], rows: list[list]) -> str | None:
     """
     Write table data to a temporary CSV file.
 
+    Identical (columns, rows) payloads are deduplicated by content hash
+    and reuse the previously written file.
+
     Args:
         columns: list of column names
         rows: list of row data (each row is a list)
@@ -145,7 +256,22 @@ def table_to_csv_tempfile(columns: list[str], rows: list[list]) -> str | None:
     if not columns and not rows:
         return None
 
-    # Create unique temp file
+    # Dedup on content hash; fall through to a fresh write if the cached
+    # file has been cleaned up underneath us
+    key = hashlib.blake2b(
+        _json_dumps_bytes([columns, rows]), digest_size=16
+    ).hexdigest()
+    cached_path = _CSV_CACHE.get(key)
+    if cached_path is not None and os.path.exists(cached_path):
+        _CSV_CACHE.move_to_end(key)
+        return cached_path
+
+    # Build the CSV in memory first, then write once
+    buffer = io.StringIO(newline="")
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    writer.writerows(rows)
+
     temp_file = tempfile.NamedTemporaryFile(
         mode="w",
         suffix=".csv",
@@ -155,15 +281,17 @@ def table_to_csv_tempfile(columns: list[str], rows: list[list]) -> str | None:
     )
 
     try:
-        writer = csv.writer(temp_file)
-        writer.writerow(columns)
-        writer.writerows(rows)
+        temp_file.write(buffer.getvalue())
         temp_file.close()
-        return temp_file.name
     except Exception:
         temp_file.close()
         return None
 
+    _CSV_CACHE[key] = temp_file.name
+    while len(_CSV_CACHE) > _CSV_CACHE_MAX:
+        _CSV_CACHE.popitem(last=False)
+    return temp_file.name
+
 
 def png_bytes_to_base64(png_bytes: bytes) -> str:
     """
@@ -175,7 +303,8 @@ def png_bytes_to_base64(png_bytes: bytes) -> str:
     Returns:
         Base64-encoded string
     """
-    return base64.b64encode(png_bytes).decode("utf-8")
+    # base64 output is strictly ASCII; ascii decode is cheaper than utf-8
+    return _b64encode(png_bytes).decode("ascii")
 
 
 def base64_to_png_bytes(base64_str: str) -> bytes:
@@ -188,7 +317,7 @@ def base64_to_png_bytes(base64_str: str) -> bytes:
     Returns:
         Raw PNG image bytes
     """
-    return base64.b64decode(base64_str)
+    return _b64decode(base64_str)
 
 
 def create_table_artifact(
@@ -244,7 +373,12 @@ def generate_unique_chart_path() -> str:
     """
     Generate a unique path for chart temp file.
 
+    Uses mkstemp so the file is created atomically (no path-guessing
+    races in the shared temp dir); the caller overwrites it via savefig.
+
     Returns:
-        Path like /tmp/chart_<uuid>.png
+        Path like /tmp/chart_<random>.png
     """
-    return f"{tempfile.gettempdir()}/chart_{uuid.uuid4().hex}.png"
+    fd, path = tempfile.mkstemp(prefix="chart_", suffix=".png")
+    os.close(fd)
+    return path
@@ -4,16 +4,48 @@ Database operations for Azure SQL Server connection.
 Phase 6: Production-grade enhancements with validation, timeouts, and retry logic.
 """
 
+import datetime
+import decimal
+import functools
+import hashlib
+import io
 import os
 import pyodbc
 import json
+import queue
+import random
+import re
+import threading
 import time
 import logging
+from contextlib import contextmanager, nullcontext
 from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
+try:
+    # C-accelerated serialization for result payloads; the stdlib
+    # fallback keeps the module usable without orjson
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    def _dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+try:
+    # Optional AST-level SQL guardrail; the regex checks in
+    # validate_sql_query remain the always-available fallback
+    import sqlglot
+    from sqlglot import exp as _sqlglot_exp
+except ImportError:
+    sqlglot = None
+
+# Enable ODBC driver-level connection pooling as well
+pyodbc.pooling = True
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,6 +59,124 @@ QUERY_TIMEOUT = 30
 # Retry configuration
 MAX_RETRIES = 3
 RETRY_DELAY = 1  # Initial delay in seconds
+MAX_BACKOFF = 30  # Cap on any single retry delay in seconds
+
+# SQLSTATEs worth retrying: connection drops (08xxx), deadlock/serialization
+# failures (40xxx), and driver timeouts (HYT00/HYT01)
+TRANSIENT_SQLSTATES = frozenset({
+    '08S01', '08001', '08003', '08007',
+    '40001', '40P01',
+    'HYT00', 'HYT01',
+    '01000',
+})
+
+# Connection pool configuration
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "8"))
+POOL_IDLE_VALIDATE_SECONDS = 300  # Ping connections idle longer than this
+
+# Pool of (connection, last_used_ts) tuples. LIFO so the most recently
+# used (warmest) connection is handed out first.
+_pool: queue.LifoQueue = queue.LifoQueue(maxsize=POOL_MAX_SIZE)
+
+# TTL cache for INFORMATION_SCHEMA lookups. The schema is effectively
+# static within a chatbot session, but table names and schema text are
+# requested on every turn; caching collapses those to one round-trip
+# per TTL window.
+SCHEMA_CACHE_TTL = 300  # seconds
+_schema_cache: dict[tuple, tuple[float, object]] = {}
+_schema_cache_lock = threading.Lock()
+
+# Disk tier under ~/.cache/fin_chatbot: schema and sample data are
+# effectively static between launches, so persisting them lets a repeat
+# startup skip the metadata round trips entirely. Entries are keyed by
+# database + cache key and refetched after a generous TTL (the schema
+# is also droppable explicitly via invalidate_schema_cache).
+SCHEMA_DISK_CACHE_TTL = int(os.getenv("SCHEMA_DISK_CACHE_TTL", str(24 * 3600)))
+_DISK_CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "fin_chatbot"
+)
+
+
+def _disk_cache_path(key: tuple) -> str:
+    """Path for a cache key, distinct per target server and database."""
+    ident = json.dumps([
+        os.getenv("AZURE_SQL_SERVER", ""),
+        os.getenv("AZURE_SQL_DATABASE", ""),
+        *map(str, key),
+    ])
+    digest = hashlib.blake2b(ident.encode(), digest_size=8).hexdigest()
+    return os.path.join(_DISK_CACHE_DIR, f"schema_{digest}.json")
+
+
+def _disk_cache_get(key: tuple):
+    """Read a value from the disk tier, or None if missing/expired."""
+    try:
+        with open(_disk_cache_path(key), encoding="utf-8") as f:
+            entry = json.load(f)
+        if time.time() - entry["ts"] < SCHEMA_DISK_CACHE_TTL:
+            return entry["value"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _disk_cache_put(key: tuple, value) -> None:
+    """Best-effort write-through to the disk tier."""
+    try:
+        os.makedirs(_DISK_CACHE_DIR, exist_ok=True)
+        path = _disk_cache_path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ts": time.time(), "value": value}, f)
+        os.replace(tmp, path)  # Atomic; concurrent launches race benignly
+    except OSError:
+        pass
+
+
+def _schema_cache_get(key: tuple):
+    """Return a cached value, or None if missing or expired."""
+    with _schema_cache_lock:
+        entry = _schema_cache.get(key)
+        if entry is not None and time.time() < entry[0]:
+            return entry[1]
+    # Memory miss (fresh process, usually): fall back to the disk tier
+    # and promote any hit so later lookups stay lock-and-dict only
+    value = _disk_cache_get(key)
+    if value is not None:
+        with _schema_cache_lock:
+            _schema_cache[key] = (time.time() + SCHEMA_CACHE_TTL, value)
+    return value
+
+
+def _schema_cache_put(key: tuple, value) -> None:
+    """Store a value with the standard TTL, written through to disk."""
+    with _schema_cache_lock:
+        _schema_cache[key] = (time.time() + SCHEMA_CACHE_TTL, value)
+    _disk_cache_put(key, value)
+
+
+def invalidate_schema_cache() -> None:
+    """Drop all cached schema metadata (e.g. after a migration)."""
+    with _schema_cache_lock:
+        _schema_cache.clear()
+    try:
+        for name in os.listdir(_DISK_CACHE_DIR):
+            if name.startswith("schema_") and name.endswith(".json"):
+                os.unlink(os.path.join(_DISK_CACHE_DIR, name))
+    except OSError:
+        pass
+
+
+# Query must start with SELECT (or WITH, for CTEs)
+_STATEMENT_START_RE = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+# Dangerous keywords that should not appear. Word boundaries avoid the
+# false positive where a benign identifier like UPDATED_AT contains
+# UPDATE; a single compiled alternation replaces nine substring scans.
+_FORBIDDEN_RE = re.compile(
+    r'\b(DROP|DELETE|INSERT|UPDATE|ALTER|CREATE|TRUNCATE|EXEC|EXECUTE|SP_\w*)\b',
+    re.IGNORECASE,
+)
 
 
 def validate_sql_query(query: str) -> tuple[bool, str]:
@@ -39,41 +189,78 @@ def validate_sql_query(query: str) -> tuple[bool, str]:
     Returns:
         Tuple of (is_valid, error_message)
     """
-    query_upper = query.strip().upper()
-
-    # Must be a SELECT query
-    if not query_upper.startswith("SELECT"):
+    # Must be a SELECT query (CTEs are read-only and allowed)
+    if not _STATEMENT_START_RE.match(query):
         return False, "Only SELECT queries are allowed"
 
-    # Dangerous keywords that should not appear
-    dangerous_keywords = [
-        "DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "CREATE",
-        "TRUNCATE", "EXEC", "EXECUTE", "sp_"
-    ]
+    match = _FORBIDDEN_RE.search(query)
+    if match:
+        return False, f"Query contains forbidden keyword: {match.group(1).upper()}"
 
-    for keyword in dangerous_keywords:
-        if keyword in query_upper:
-            return False, f"Query contains forbidden keyword: {keyword}"
+    # AST-level check when sqlglot is installed: confirms the statement
+    # actually *is* a read-only SELECT/set operation, catching anything
+    # the keyword regex can't see (e.g. keywords hidden in comments)
+    if sqlglot is not None:
+        try:
+            tree = sqlglot.parse_one(query, dialect="tsql")
+        except sqlglot.errors.ParseError:
+            # Unparseable SQL falls through to the server, whose error
+            # message is more useful than anything we could synthesize
+            return True, ""
+        if not isinstance(tree, (_sqlglot_exp.Select, _sqlglot_exp.Union)):
+            return False, "Only SELECT queries are allowed"
 
     return True, ""
 
 
-def get_connection() -> pyodbc.Connection:
+def enforce_row_cap(query: str, cap: int = 50) -> str:
     """
-    Create and return a connection to Azure SQL Database with timeout.
+    Inject a TOP cap into an uncapped, non-aggregate outer SELECT.
 
-    Returns:
-        pyodbc.Connection: Active database connection
+    The prompt asks the LLM for TOP 50 on raw listing queries, but
+    nothing enforced it; an accidental full-table SELECT then pays for
+    every row. When sqlglot is installed, the cap is added at the AST
+    level. Best-effort: on any parse or generation hiccup the original
+    query is returned unchanged.
 
-    Raises:
-        pyodbc.Error: If connection fails
+    Callers apply this at the agent layer (where the TOP-50 prompt rule
+    lives), not inside execute_sql_query: the executor stays faithful
+    to the SQL it is given, so trusted callers like the evaluator's
+    ground-truth queries are never silently truncated.
+
+    Args:
+        query: Validated SQL query string
+        cap: Maximum rows for uncapped listing queries
+
+    Returns:
+        The query, with a row cap added when it was missing one
     """
+    if sqlglot is None:
+        return query
+    try:
+        tree = sqlglot.parse_one(query, dialect="tsql")
+        if not isinstance(tree, _sqlglot_exp.Select):
+            return query
+        # Leave capped, grouped, distinct, or aggregate queries alone -
+        # those return bounded result sets by construction
+        if tree.args.get("limit") or tree.args.get("group") or tree.args.get("distinct"):
+            return query
+        if tree.find(_sqlglot_exp.AggFunc) is not None:
+            return query
+        return tree.limit(cap).sql(dialect="tsql")
+    except Exception:
+        return query
+
+
+@functools.lru_cache(maxsize=1)
+def _build_conn_str() -> str:
+    """Assemble the ODBC connection string once (env vars don't change)."""
     server = os.environ["AZURE_SQL_SERVER"]
     database = os.environ["AZURE_SQL_DATABASE"]
     username = os.environ["SQL_USERNAME"]
     password = os.environ["SQL_PASSWORD"]
 
-    conn_str = (
+    return (
         f"DRIVER={{ODBC Driver 18 for SQL Server}};"
         f"SERVER={server};"
         f"DATABASE={database};"
@@ -84,7 +271,98 @@ def get_connection() -> pyodbc.Connection:
         f"Connection Timeout={QUERY_TIMEOUT};"
     )
 
-    return pyodbc.connect(conn_str)
+
+def get_connection() -> pyodbc.Connection:
+    """
+    Create and return a connection to Azure SQL Database with timeout.
+
+    Returns:
+        pyodbc.Connection: Active database connection
+
+    Raises:
+        pyodbc.Error: If connection fails
+    """
+    return pyodbc.connect(_build_conn_str())
+
+
+def _is_connection_dead(error: pyodbc.Error) -> bool:
+    """Check whether an error's SQLSTATE indicates a broken connection."""
+    sqlstate = error.args[0] if error.args else ""
+    return isinstance(sqlstate, str) and sqlstate.startswith("08")
+
+
+@contextmanager
+def acquire_conn():
+    """
+    Borrow a connection from the pool (or open one), return it on exit.
+
+    Each fresh connect to Azure SQL pays a TLS handshake plus login
+    round-trips (~100-500 ms), which dominates short queries. Pooling
+    amortizes that across calls. Connections idle long enough to be
+    killed by Azure's idle timeout are validated with SELECT 1 before
+    reuse; connections that died mid-use are discarded instead of being
+    returned to the pool.
+
+    Yields:
+        pyodbc.Connection: Active database connection
+    """
+    try:
+        conn, last_used = _pool.get_nowait()
+        if time.time() - last_used > POOL_IDLE_VALIDATE_SECONDS:
+            try:
+                conn.execute("SELECT 1").fetchone()
+            except pyodbc.Error:
+                try:
+                    conn.close()
+                except pyodbc.Error:
+                    pass
+                conn = get_connection()
+    except queue.Empty:
+        conn = get_connection()
+
+    dead = False
+    try:
+        yield conn
+    except pyodbc.Error as e:
+        dead = _is_connection_dead(e)
+        raise
+    finally:
+        if dead:
+            try:
+                conn.close()
+            except pyodbc.Error:
+                pass
+        else:
+            try:
+                _pool.put_nowait((conn, time.time()))
+            except queue.Full:
+                conn.close()
+
+
+def warm_pool(connections: int = 2) -> None:
+    """
+    Open and pool a few validated connections ahead of first use.
+
+    Without this the session's first query pays the full TLS+login cost
+    on the critical path. Best effort: a warm-up failure is ignored and
+    real queries fall back to connecting (and retrying) as usual.
+
+    Args:
+        connections: Number of connections to pre-open
+    """
+    opened = []
+    try:
+        for _ in range(min(connections, POOL_MAX_SIZE)):
+            conn = get_connection()
+            conn.execute("SELECT 1").fetchone()
+            opened.append(conn)
+    except pyodbc.Error:
+        pass
+    for conn in opened:
+        try:
+            _pool.put_nowait((conn, time.time()))
+        except queue.Full:
+            conn.close()
 
 
 def get_table_names() -> list[str]:
@@ -94,8 +372,9 @@ def get_table_names() -> list[str]:
     Returns:
         List of table names
     """
-    conn = get_connection()
-    cursor = conn.cursor()
+    cached = _schema_cache_get(("table_names",))
+    if cached is not None:
+        return cached
 
     query = """
     SELECT TABLE_NAME
@@ -104,12 +383,13 @@ def get_table_names() -> list[str]:
     ORDER BY TABLE_NAME
     """
 
-    cursor.execute(query)
-    tables = [row.TABLE_NAME for row in cursor.fetchall()]
-
-    cursor.close()
-    conn.close()
+    with acquire_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        tables = [row.TABLE_NAME for row in cursor.fetchall()]
+        cursor.close()
 
+    _schema_cache_put(("table_names",), tables)
     return tables
 
 
@@ -123,46 +403,117 @@ def get_table_schema(table_name: Optional[str] = None) -> str:
     Returns:
         Formatted string with schema information
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    if table_name:
-        query = """
-        SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = 'dbo' AND TABLE_NAME = ?
-        ORDER BY ORDINAL_POSITION
-        """
-        cursor.execute(query, (table_name,))
-    else:
-        query = """
-        SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = 'dbo'
-        ORDER BY TABLE_NAME, ORDINAL_POSITION
-        """
-        cursor.execute(query)
+    cached = _schema_cache_get(("table_schema", table_name))
+    if cached is not None:
+        return cached
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with acquire_conn() as conn:
+        cursor = conn.cursor()
+
+        if table_name:
+            query = """
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = 'dbo' AND TABLE_NAME = ?
+            ORDER BY ORDINAL_POSITION
+            """
+            cursor.execute(query, (table_name,))
+        else:
+            query = """
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = 'dbo'
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+            """
+            cursor.execute(query)
+
+        rows = cursor.fetchall()
+        cursor.close()
 
     if not rows:
         return f"No schema information found for table: {table_name}" if table_name else "No tables found"
 
-    # Format schema information
-    schema_info = []
+    # Format schema information into a single buffer rather than a
+    # temporary list of per-column strings joined at the end
+    buf = io.StringIO()
     current_table = None
 
     for row in rows:
         if row.TABLE_NAME != current_table:
             current_table = row.TABLE_NAME
-            schema_info.append(f"\nTable: {current_table}")
+            buf.write(f"\nTable: {current_table}")
 
         nullable = "NULL" if row.IS_NULLABLE == "YES" else "NOT NULL"
-        schema_info.append(f"  - {row.COLUMN_NAME}: {row.DATA_TYPE} ({nullable})")
+        buf.write(f"\n  - {row.COLUMN_NAME}: {row.DATA_TYPE} ({nullable})")
+
+    result = buf.getvalue()
+    _schema_cache_put(("table_schema", table_name), result)
+    return result
 
-    return "\n".join(schema_info)
+
+def get_table_schema_compact() -> str:
+    """
+    Get schema information in a compact one-line-per-table form.
+
+    Emits Table(col:type, col:type?, ...) with '?' marking nullable
+    columns - the same information get_table_schema() spreads over one
+    line per column, at roughly a third of the prompt tokens.
+
+    Returns:
+        Formatted string, one line per table
+    """
+    cached = _schema_cache_get(("table_schema_compact",))
+    if cached is not None:
+        return cached
+
+    with acquire_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = 'dbo'
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+
+    if not rows:
+        return "No tables found"
+
+    tables: dict[str, list[str]] = {}
+    for row in rows:
+        suffix = "?" if row.IS_NULLABLE == "YES" else ""
+        tables.setdefault(row.TABLE_NAME, []).append(
+            f"{row.COLUMN_NAME}:{row.DATA_TYPE}{suffix}"
+        )
+
+    result = "\n".join(
+        f"{table}({', '.join(cols)})" for table, cols in tables.items()
+    )
+    _schema_cache_put(("table_schema_compact",), result)
+    return result
+
+
+def _format_sample_rows(table_name: str, columns: list[str], rows) -> str:
+    """Format fetched sample rows in the shared prompt-context style."""
+    if not rows:
+        return f"Table {table_name} is empty"
+
+    sample_lines = [f"\nSample data from {table_name}:"]
+    for row in rows:
+        row_dict = {}
+        for i, column in enumerate(columns):
+            value = row[i]
+            # Convert date/datetime to string
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            # Convert Decimal to float
+            elif hasattr(value, '__float__'):
+                value = float(value)
+            row_dict[column] = value
+        sample_lines.append(f"  {_dumps(row_dict)}")
+
+    return "\n".join(sample_lines)
 
 
 def get_sample_data(table_name: str, limit: int = 3) -> str:
@@ -176,55 +527,177 @@ def get_sample_data(table_name: str, limit: int = 3) -> str:
     Returns:
         Formatted string with sample data or error message
     """
+    cached = _schema_cache_get(("sample_data", table_name, limit))
+    if cached is not None:
+        return cached
+
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        # Whitelist the identifier against the real table list (cached by
+        # get_table_names) instead of interpolating caller input directly
+        if table_name not in get_table_names():
+            logger.warning(f"Rejected sample data request for unknown table: {table_name}")
+            return f"Could not retrieve sample data from {table_name}"
 
-        # Use TOP for SQL Server
-        query = f"SELECT TOP {limit} * FROM {table_name}"
-        cursor.execute(query)
+        quoted_ident = "[" + table_name.replace("]", "]]") + "]"
 
-        columns = [column[0] for column in cursor.description]
-        rows = cursor.fetchall()
+        with acquire_conn() as conn:
+            cursor = conn.cursor()
 
-        cursor.close()
-        conn.close()
-
-        if not rows:
-            return f"Table {table_name} is empty"
-
-        # Format sample data
-        sample_lines = [f"\nSample data from {table_name}:"]
-        for row in rows:
-            row_dict = {}
-            for i, column in enumerate(columns):
-                value = row[i]
-                # Convert date/datetime to string
-                if hasattr(value, 'isoformat'):
-                    value = value.isoformat()
-                # Convert Decimal to float
-                elif hasattr(value, '__float__'):
-                    value = float(value)
-                row_dict[column] = value
-            sample_lines.append(f"  {json.dumps(row_dict, ensure_ascii=False)}")
-
-        return "\n".join(sample_lines)
+            # Parameterized TOP via sp_executesql keeps one cached plan
+            # per table on the server regardless of the limit value
+            cursor.execute(
+                f"EXEC sp_executesql N'SELECT TOP (@n) * FROM {quoted_ident}', N'@n INT', @n=?",
+                limit,
+            )
+
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+
+            cursor.close()
+
+        result = _format_sample_rows(table_name, columns, rows)
+        if rows:
+            _schema_cache_put(("sample_data", table_name, limit), result)
+        return result
 
     except Exception as e:
         logger.error(f"Error getting sample data from {table_name}: {e}")
         return f"Could not retrieve sample data from {table_name}"
 
 
-def execute_sql_query(query: str, retry: bool = True) -> str:
+def get_sample_data_bulk(table_names: list[str], limit: int = 3) -> list[str]:
+    """
+    Get sample data for several tables in one database round trip.
+
+    Batches one SELECT per table into a single statement and walks the
+    result sets with cursor.nextset(), so startup pays roughly one WAN
+    round trip instead of one per table. Results flow through the same
+    cache as get_sample_data; only tables missing from it are fetched.
+
+    Args:
+        table_names: Tables to sample (unknown names get the same
+            per-table error string get_sample_data produces)
+        limit: Number of sample rows per table
+
+    Returns:
+        List of formatted per-table sample strings, in input order
+    """
+    results: dict[str, str] = {}
+    try:
+        known = get_table_names()
+    except Exception as e:
+        logger.error(f"Error getting sample data in bulk: {e}")
+        return [f"Could not retrieve sample data from {t}" for t in table_names]
+
+    to_fetch = []
+    for table_name in table_names:
+        cached = _schema_cache_get(("sample_data", table_name, limit))
+        if cached is not None:
+            results[table_name] = cached
+        elif table_name not in known:
+            logger.warning(f"Rejected sample data request for unknown table: {table_name}")
+            results[table_name] = f"Could not retrieve sample data from {table_name}"
+        else:
+            to_fetch.append(table_name)
+
+    if to_fetch:
+        # Identifiers are whitelisted above and bracket-quoted here; the
+        # limit rides as a parameter per statement
+        batch = "; ".join(
+            "SELECT TOP (?) * FROM [" + t.replace("]", "]]") + "]" for t in to_fetch
+        )
+        try:
+            with acquire_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute(batch, [limit] * len(to_fetch))
+                for table_name in to_fetch:
+                    columns = [column[0] for column in cursor.description]
+                    rows = cursor.fetchall()
+                    formatted = _format_sample_rows(table_name, columns, rows)
+                    if rows:
+                        _schema_cache_put(("sample_data", table_name, limit), formatted)
+                    results[table_name] = formatted
+                    cursor.nextset()
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error getting sample data in bulk: {e}")
+            for table_name in to_fetch:
+                results.setdefault(
+                    table_name, f"Could not retrieve sample data from {table_name}"
+                )
+
+    return [results[table_name] for table_name in table_names]
+
+
+def load_schema_context(sample_limit: int = 2) -> tuple[str, str, int]:
+    """
+    Load the LLM schema context: compact schema plus sample rows.
+
+    Shared startup bootstrap for the CLI and the web UI. Warms the
+    connection pool, fetches the compact schema, and batch-samples every
+    table, overlapping the independent round trips on a small thread
+    pool (a warm schema cache makes all of it near-instant).
+
+    Args:
+        sample_limit: Sample rows to fetch per table
+
+    Returns:
+        Tuple of (schema_info, sample_data_info, table_count)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        # Pre-open pooled connections while the schema loads, so the
+        # first real query doesn't pay the connect cost
+        executor.submit(warm_pool)
+        schema_future = executor.submit(get_table_schema_compact)
+        table_names = get_table_names()
+        sample_parts = get_sample_data_bulk(table_names, limit=sample_limit)
+        schema_info = schema_future.result()
+
+    return schema_info, "\n".join(sample_parts), len(table_names)
+
+
+# How many rows each fetchmany() call pulls from the driver at once
+FETCH_BATCH_SIZE = 1000
+
+
+def _column_converter(type_code):
+    """
+    Pick a JSON-serialization converter for a column from its type code.
+
+    Decided once per column from cursor.description instead of probing
+    every cell with hasattr; returns None for types json can serialize
+    directly.
+    """
+    if type_code is decimal.Decimal:
+        return lambda v: float(v) if v is not None else None
+    if type_code in (datetime.date, datetime.datetime, datetime.time):
+        return lambda v: v.isoformat() if v is not None else None
+    return None
+
+
+def execute_sql_query(
+    query: str,
+    retry: bool = True,
+    conn: Optional[pyodbc.Connection] = None,
+    return_raw: bool = False,
+) -> str | list | dict:
     """
     Execute a SQL query and return results as JSON with validation, timeout, and retry logic.
 
     Args:
         query: SQL query string to execute
         retry: Whether to retry on transient failures
+        conn: Existing connection to reuse; caller keeps ownership and
+            handles close. When None, a pooled connection is used.
+        return_raw: Return the Python list/dict directly instead of a
+            JSON string, skipping a serialize/parse round-trip for
+            in-process callers like the evaluator
 
     Returns:
-        JSON string with query results or error message
+        JSON string with query results or error message; with
+        return_raw, the results list (or error dict) itself
 
     Note:
         Only SELECT queries are allowed for safety.
@@ -233,10 +706,11 @@ def execute_sql_query(query: str, retry: bool = True) -> str:
     is_valid, error_msg = validate_sql_query(query)
     if not is_valid:
         logger.warning(f"Query validation failed: {error_msg}")
-        return json.dumps({
+        error_payload = {
             "error": error_msg,
             "query": query
-        })
+        }
+        return error_payload if return_raw else _dumps(error_payload)
 
     # Execute with retry logic
     last_error = None
@@ -244,53 +718,58 @@ def execute_sql_query(query: str, retry: bool = True) -> str:
         try:
             logger.info(f"Executing query (attempt {attempt + 1}/{MAX_RETRIES if retry else 1})")
 
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            # Set query timeout
-            cursor.execute(f"SET LOCK_TIMEOUT {QUERY_TIMEOUT * 1000}")  # milliseconds
-
-            cursor.execute(query)
-            columns = [column[0] for column in cursor.description]
-            rows = cursor.fetchall()
-
-            # Convert rows to list of dicts
-            results = []
-            for row in rows:
-                row_dict = {}
-                for i, column in enumerate(columns):
-                    value = row[i]
-                    # Convert date/datetime to string for JSON serialization
-                    if hasattr(value, 'isoformat'):
-                        value = value.isoformat()
-                    # Convert Decimal to float
-                    elif hasattr(value, '__float__'):
-                        value = float(value)
-                    row_dict[column] = value
-                results.append(row_dict)
-
-            cursor.close()
-            conn.close()
+            conn_ctx = nullcontext(conn) if conn is not None else acquire_conn()
+            with conn_ctx as active_conn:
+                cursor = active_conn.cursor()
+
+                # Set query timeout
+                cursor.execute(f"SET LOCK_TIMEOUT {QUERY_TIMEOUT * 1000}")  # milliseconds
+
+                cursor.execute(query)
+                cursor.arraysize = FETCH_BATCH_SIZE
+                columns = [column[0] for column in cursor.description]
+                converters = [_column_converter(column[1]) for column in cursor.description]
+
+                # Stream rows in batches instead of fetchall(), applying the
+                # per-column converters decided above
+                results = []
+                while True:
+                    batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+                    if not batch:
+                        break
+                    for row in batch:
+                        results.append({
+                            column: (convert(value) if convert else value)
+                            for column, convert, value in zip(columns, converters, row)
+                        })
+
+                cursor.close()
 
             logger.info(f"Query executed successfully, returned {len(results)} rows")
-            return json.dumps(results, indent=2)
+            if return_raw:
+                return results
+            # No indent: the payload is machine-consumed (LLM context,
+            # evaluator json.loads), pretty-printing is pure overhead
+            return _dumps(results)
 
         except pyodbc.Error as e:
             last_error = e
             logger.error(f"Database error on attempt {attempt + 1}: {e}")
 
-            # Check if it's a transient error worth retrying
-            error_str = str(e).lower()
-            transient_errors = ['timeout', 'connection', 'network', 'deadlock']
-            is_transient = any(err in error_str for err in transient_errors)
+            # Check if it's a transient error worth retrying. SQLSTATE is
+            # an O(1) membership test and, unlike substring-matching the
+            # message, robust to driver locale
+            is_transient = bool(e.args) and e.args[0] in TRANSIENT_SQLSTATES
 
             if not retry or not is_transient or attempt == MAX_RETRIES - 1:
                 # Don't retry or last attempt
                 break
 
-            # Exponential backoff
-            delay = RETRY_DELAY * (2 ** attempt)
-            logger.info(f"Retrying in {delay} seconds...")
+            # Exponential backoff with full jitter: a random delay in
+            # [0, RETRY_DELAY * 2^attempt] desynchronizes concurrent
+            # retriers so they don't hammer the server in lockstep
+            delay = min(MAX_BACKOFF, random.uniform(0, RETRY_DELAY * (2 ** attempt)))
+            logger.info(f"Retrying in {delay:.2f} seconds...")
             time.sleep(delay)
 
         except Exception as e:
@@ -300,8 +779,9 @@ def execute_sql_query(query: str, retry: bool = True) -> str:
 
     # All retries failed
     error_message = str(last_error) if last_error else "Unknown error"
-    return json.dumps({
+    error_payload = {
         "error": error_message,
         "query": query,
         "attempts": attempt + 1
-    })
+    }
+    return error_payload if return_raw else _dumps(error_payload)
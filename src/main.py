@@ -10,6 +10,17 @@ Usage:
 """
 
 import argparse
+import asyncio
+import atexit
+import functools
+import hashlib
+import io
+import re
+import statistics
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
 from typing import Annotated, Literal
 from typing_extensions import TypedDict
 
@@ -18,20 +29,107 @@ from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, Base
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langfuse.callback import CallbackHandler
+from pydantic import BaseModel
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
-import matplotlib
+import numpy as np
 import os
 import json
 import uuid
 import db
 import artifacts
 
-# Use non-interactive backend for matplotlib
-matplotlib.use("Agg")
-
 load_dotenv()
 
+@functools.lru_cache(maxsize=1)
+def _http_client():
+    """Shared HTTP transport for all LLM calls in this process.
+
+    Keep-alive connections (and HTTP/2 multiplexing when the h2 package
+    is present) avoid a TCP+TLS handshake per LLM turn — the CLI makes
+    up to three per question. Mirrors the client setup in app.py.
+    """
+    import httpx
+    try:
+        import h2  # noqa: F401  (presence check only)
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_keepalive_connections=10,
+            max_connections=20,
+            keepalive_expiry=300.0,
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _http_async_client():
+    """Async counterpart of _http_client, used by the ainvoke/astream path."""
+    import httpx
+    try:
+        import h2  # noqa: F401  (presence check only)
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_keepalive_connections=10,
+            max_connections=20,
+            keepalive_expiry=300.0,
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+
+
+# All async graph work runs on one long-lived event loop on a daemon
+# thread. Spinning up a fresh loop per turn (asyncio.run in the REPL, or
+# per eval worker thread) breaks the cached AsyncClient above: its
+# keep-alive connections outlive the loop they were opened on, and the
+# next turn's new loop fails with "Event loop is closed" when it reuses
+# them. A single loop also lets the eval runner's worker threads share
+# the connection pool safely via run_coroutine_threadsafe.
+_async_loop: "asyncio.AbstractEventLoop | None" = None
+_async_loop_lock = threading.Lock()
+
+
+def _get_async_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) and return the shared background event loop."""
+    global _async_loop
+    with _async_loop_lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="async-loop", daemon=True
+            ).start()
+            _async_loop = loop
+    return _async_loop
+
+
+def _run_async(coro):
+    """Run a coroutine on the shared loop and block for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_async_loop()).result()
+
+
+try:
+    # C-accelerated JSON for the hot path (routing decisions, SQL
+    # result payloads, prompt-context serialization); stdlib fallback
+    # keeps the module usable without orjson
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj, default=str).decode()
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, default=str)
+
 
 # Multi-agent state definition
 class MultiAgentState(TypedDict):
@@ -41,8 +139,11 @@ class MultiAgentState(TypedDict):
     user_question: Current user question
     needs_sql: Whether SQL query is needed
     needs_viz: Whether visualization is needed
+    speculative_sql: SQL generated speculatively alongside routing
     sql_query: Generated SQL query
     sql_results: Query results (JSON string) - for LLM context
+    sql_results_parsed: Query results parsed once by sql_agent; viz and
+        response agents reuse the object instead of re-parsing the JSON
     chart_type: Type of chart to generate (bar, line, pie, etc.)
     chart_path: Path to generated chart image (UUID-based)
     final_response: Synthesized response for user
@@ -59,8 +160,10 @@ class MultiAgentState(TypedDict):
     user_question: str
     needs_sql: bool
     needs_viz: bool
+    speculative_sql: str | None
     sql_query: str | None
     sql_results: str | None
+    sql_results_parsed: list | None
     chart_type: str | None
     chart_path: str | None
     final_response: str | None
@@ -72,162 +175,310 @@ class MultiAgentState(TypedDict):
     show_table: bool
 
 
-def create_multi_agent_system(llm: AzureChatOpenAI, schema_info: str, sample_data_info: str):
-    """Create a multi-agent system with Supervisor, SQL, Viz, and Response agents.
+# TTL cache of SQL result JSON keyed by normalized query text. Identical
+# SQL (the same question re-asked during a session) skips the round trip
+# to SQL Server entirely. Disable with --no-cache for time-sensitive work.
+SQL_CACHE_TTL = 3600  # seconds
+_SQL_CACHE_MAX = 128
+_sql_cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+_sql_cache_enabled = True
 
-    Architecture:
-    - Supervisor: Analyzes user intent, decides which agents to invoke
-    - SQL Agent: Generates and executes SQL queries
-    - Viz Agent: Creates visualizations with matplotlib
-    - Response Agent: Synthesizes final response
+
+def _cached_execute(sql_query: str) -> str:
+    """Execute an LLM-generated query through the TTL'd result cache.
+
+    The runaway-listing row cap applies here, at the agent layer where
+    the prompt's TOP-50 rule lives (no-op unless sqlglot is installed).
+    db.execute_sql_query itself stays faithful to the SQL it is given,
+    so trusted callers — the evaluator's ground-truth queries — are
+    never silently truncated.
+    """
+    sql_query = db.enforce_row_cap(sql_query)
+    if not _sql_cache_enabled:
+        return db.execute_sql_query(sql_query)
+
+    key = " ".join(sql_query.split()).lower()
+    entry = _sql_cache.get(key)
+    if entry is not None and time.time() < entry[0]:
+        _sql_cache.move_to_end(key)
+        return entry[1]
+
+    results = db.execute_sql_query(sql_query)
+
+    # Error payloads are JSON objects; only cache successful row lists
+    if results.lstrip().startswith("["):
+        _sql_cache[key] = (time.time() + SQL_CACHE_TTL, results)
+        while len(_sql_cache) > _SQL_CACHE_MAX:
+            _sql_cache.popitem(last=False)
+
+    return results
+
+
+# Exact-match response cache for the chat loop, keyed on the normalized
+# question plus a hash of the recent context (same scheme app.py uses).
+# Verbatim repeats - common for questions like "what's my balance?" -
+# skip the whole graph run for free; the semantic cache below handles
+# near-duplicates when an embedding deployment is configured. Entries
+# with time-sensitive wording are never cached.
+_RESPONSE_CACHE: OrderedDict[tuple, dict] = OrderedDict()
+_RESPONSE_CACHE_MAX = 128
+_TIME_SENSITIVE_RE = re.compile(
+    r"\b(today|now|current|yesterday|this (?:hour|minute|week|month|year)|last hour)\b"
+)
+
+
+def _schema_fingerprint() -> str:
+    """Cheap fingerprint of the current database schema.
+
+    Cached answers are data-shape-dependent: a schema change (new
+    column, renamed table) can make a previously correct answer wrong
+    even for the identical question, so both response caches fold this
+    into their keys. Reads through db's own schema cache, so it costs a
+    dict lookup on the hot path.
     """
+    try:
+        return hashlib.blake2b(
+            db.get_table_schema_compact().encode(), digest_size=8
+        ).hexdigest()
+    except Exception:
+        return ""
 
-    # =========================================================================
-    # SUPERVISOR AGENT - Routes to other agents
-    # =========================================================================
-    def supervisor(state: MultiAgentState) -> dict:
-        """Analyze user question and decide which agents to invoke."""
-        messages = state["messages"]
-        user_question = messages[-1].content if messages else ""
-
-        system_prompt = """You are a routing supervisor for a finance assistant.
-Analyze the user's question and decide what's needed.
-
-Respond with a JSON object (no markdown, just raw JSON):
-{
-    "needs_sql": true/false,
-    "needs_viz": true/false,
-    "chart_type": "bar" | "line" | "pie" | null,
-    "reasoning": "brief explanation"
-}
-
-Guidelines:
-- needs_sql: true for any data question (amounts, counts, lists, totals)
-- needs_viz: true ONLY for aggregated data with trends/comparisons/distributions
-- needs_viz: FALSE for listing individual transactions or showing raw data
-- chart_type:
-  - "bar" for category comparisons (by merchant, by type)
-  - "line" for time series (by month, by week, trends)
-  - "pie" for proportions (percentage breakdown)
-  - null if no visualization needed
 
-Examples:
-- "What's my total spend?" → {"needs_sql": true, "needs_viz": false, "chart_type": null}
-- "Show expenses by category" → {"needs_sql": true, "needs_viz": true, "chart_type": "bar"}
-- "How has spending changed over time?" → {"needs_sql": true, "needs_viz": true, "chart_type": "line"}
-- "Show me all transactions" → {"needs_sql": true, "needs_viz": false, "chart_type": null}
-- "List transactions from December" → {"needs_sql": true, "needs_viz": false, "chart_type": null}
-"""
+def _response_cache_key(question: str, messages) -> tuple | None:
+    """Build a response-cache key, or None if the turn is uncacheable."""
+    normalized = " ".join(question.lower().split())
+    if _TIME_SENSITIVE_RE.search(normalized):
+        return None
+    tail = "\x1f".join(msg.content[:300] for msg in list(messages)[-4:])
+    return (
+        normalized,
+        hashlib.blake2b(tail.encode(), digest_size=8).hexdigest(),
+        _schema_fingerprint(),
+    )
 
-        try:
-            response = llm.invoke([
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=f"User question: {user_question}"),
-            ])
-
-            # Parse JSON response
-            content = response.content.strip()
-            # Clean up markdown if present
-            if content.startswith("```"):
-                content = content.split("```")[1]
-                if content.startswith("json"):
-                    content = content[4:]
-                content = content.strip()
-
-            routing = json.loads(content)
 
-            return {
-                "user_question": user_question,
-                "needs_sql": routing.get("needs_sql", True),
-                "needs_viz": routing.get("needs_viz", False),
-                "chart_type": routing.get("chart_type"),
-                "sql_query": None,
-                "sql_results": None,
-                "chart_path": None,
-                "final_response": None,
-                "error": None,
-                # Reset artifact fields
-                "table_columns": None,
-                "table_rows": None,
-                "row_count": None,
-                "show_table": False,
-            }
+# Optional semantic response cache: near-duplicate questions skip the
+# whole graph run (three LLM calls plus the SQL round trip) at the cost
+# of one embedding call per question. Enabled only when an embedding
+# deployment is configured; --no-cache disables it along with the SQL
+# cache. Entries are tagged with the schema fingerprint they were
+# computed under; a schema change flushes the lot (answers are
+# data-dependent, so keeping them would replay stale results).
+_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+_SEMANTIC_CACHE_MAX = 256
+_semantic_cache: list[tuple[np.ndarray, dict]] = []
+_semantic_cache_schema: str | None = None
+
+
+def _semantic_cache_check_epoch() -> None:
+    """Flush the semantic cache if the schema changed since it was filled."""
+    global _semantic_cache_schema
+    fingerprint = _schema_fingerprint()
+    if fingerprint != _semantic_cache_schema:
+        _semantic_cache.clear()
+        _semantic_cache_schema = fingerprint
+
+
+@functools.lru_cache(maxsize=1)
+def _embeddings_client():
+    """Embedding client for the semantic cache, or None when unconfigured."""
+    deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+    if not deployment:
+        return None
+    from langchain_openai import AzureOpenAIEmbeddings
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        azure_deployment=deployment,
+        api_version="2024-02-01",
+        api_key=os.environ["AZURE_OPENAI_API_KEY"],
+    )
 
-        except Exception:
-            # Default to SQL only on parsing errors
-            return {
-                "user_question": user_question,
-                "needs_sql": True,
-                "needs_viz": False,
-                "chart_type": None,
-                "error": None,
-                # Reset artifact fields
-                "table_columns": None,
-                "table_rows": None,
-                "row_count": None,
-                "show_table": False,
+
+def _embed_question(question: str) -> np.ndarray | None:
+    """Unit-norm embedding of a question, or None when unavailable."""
+    client = _embeddings_client()
+    if client is None:
+        return None
+    try:
+        vec = np.asarray(client.embed_query(question), dtype=np.float64)
+    except Exception:
+        return None  # Cache lookups must never take the turn down
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else None
+
+
+def _semantic_cache_lookup(question: str) -> tuple[np.ndarray | None, dict | None]:
+    """Look up a near-duplicate question; returns (embedding, hit-or-None).
+
+    The embedding is returned either way so a subsequent store doesn't
+    have to recompute it. Time-sensitive questions are excluded — same
+    policy as the exact-match caches — by returning (None, None), which
+    also makes the paired store a no-op.
+
+    Unlike _response_cache_key, the key here is the question embedding
+    alone, with no conversation-context component: a context-dependent
+    follow-up ("and for January?") can hit an entry recorded under a
+    different context. The 0.92 similarity threshold keeps such bare
+    fragments from matching fuller questions in practice, and the
+    trade-off buys hits across phrasing variants — but lower the
+    threshold with that in mind.
+    """
+    if not _sql_cache_enabled:
+        return None, None
+    if _TIME_SENSITIVE_RE.search(question.lower()):
+        return None, None
+    _semantic_cache_check_epoch()
+    emb = _embed_question(question)
+    if emb is None or not _semantic_cache:
+        return emb, None
+    # Vectors are unit-norm, so the dot product is cosine similarity
+    sims = np.stack([vec for vec, _ in _semantic_cache]) @ emb
+    best = int(sims.argmax())
+    if sims[best] >= _SEMANTIC_CACHE_THRESHOLD:
+        return emb, _semantic_cache[best][1]
+    return emb, None
+
+
+def _semantic_cache_store(emb: np.ndarray | None, result: dict) -> None:
+    """Record a finished graph result under its question embedding.
+
+    Time-sensitive questions never reach here with an embedding: the
+    paired lookup returns emb=None for them, so they are never stored.
+    """
+    if emb is None or not _sql_cache_enabled:
+        return
+    if result.get("error") or not result.get("final_response"):
+        return  # Don't pin failures
+    _semantic_cache_check_epoch()
+    _semantic_cache.append((emb, result))
+    while len(_semantic_cache) > _SEMANTIC_CACHE_MAX:
+        del _semantic_cache[0]
+
+
+# Markdown code fences around LLM output (```sql ... ```, ```json ... ```
+# or bare ```); one compiled pattern replaces the chained startswith/split
+# logic, which also crashed on responses without a closing fence
+_FENCE_RE = re.compile(r"```(?:sql|json)?\s*(.*?)```", re.DOTALL)
+
+# Maximum rows of SQL results embedded in the response agent's prompt
+_RESPONSE_CONTEXT_MAX_ROWS = 15
+
+# Column names that denote money, for the single-cell response shortcut:
+# only these get CZK/two-decimal formatting (a COUNT(*) is not currency)
+_AMOUNT_COL_RE = re.compile(
+    r"amount|total|spend|spent|income|sum|balance|price|cost", re.IGNORECASE
+)
+
+# Static halves of the response agent's system prompt; only the context
+# block between them varies per turn
+_RESPONSE_PROMPT_HEADER = "You are a helpful finance assistant presenting results.\n\n"
+_RESPONSE_PROMPT_FOOTER = """
+
+Provide a clear, natural language summary of the results.
+- Be concise but informative
+- Highlight key numbers or insights
+- Format numbers nicely (use commas for thousands)
+- Always use 'CZK' as the currency when presenting monetary amounts (Czech Koruna), never '$'. Example: '4,604.81 CZK'
+- If a chart was generated, you can briefly mention it exists (e.g., "see the chart for visual breakdown")
+- Do NOT mention file paths or where charts are saved"""
+
+# Message objects are immutable once built; construct the fixed human
+# turns once instead of on every call
+_RESPONSE_HUMAN_MSG = HumanMessage(content="Summarize the results for the user.")
+_EXPLAIN_ERROR_MSG = HumanMessage(content="Explain the error to the user.")
+
+
+def _results_for_context(sql_results: str) -> str:
+    """
+    Cap the result rows embedded in the response prompt.
+
+    Listing queries can return many KB of JSON, and prompt tokens scale
+    both latency and cost; the narrative summary only needs a sample of
+    rows plus the total count.
+    """
+    try:
+        data = _json_loads(sql_results)
+    except ValueError:
+        return sql_results
+
+    if not isinstance(data, list) or len(data) <= _RESPONSE_CONTEXT_MAX_ROWS:
+        return sql_results
+
+    truncated = _json_dumps(data[:_RESPONSE_CONTEXT_MAX_ROWS])
+    return f"[showing {_RESPONSE_CONTEXT_MAX_ROWS} of {len(data)} rows] {truncated}"
+
+
+# Row/cell budgets for the summarized result context below
+_SUMMARY_HEAD_ROWS = 3
+_SUMMARY_TAIL_ROWS = 2
+_SUMMARY_MAX_ROWS = 8
+_SUMMARY_MAX_CELL = 80
+
+
+def _summarize_results_for_llm(parsed: list) -> str:
+    """Compact representation of parsed result rows for the response prompt.
+
+    The narrative summary only needs a sample of rows plus per-column
+    aggregates; shipping the whole JSON blob scales prompt tokens (cost
+    and latency) with the row count. The full table still reaches the
+    UI through table_rows.
+    """
+    def _clip(row: dict) -> dict:
+        return {
+            k: (v[:_SUMMARY_MAX_CELL] if isinstance(v, str) else v)
+            for k, v in row.items()
+        }
+
+    if len(parsed) <= _SUMMARY_MAX_ROWS:
+        return _json_dumps([_clip(r) for r in parsed])
+
+    sample = (
+        [_clip(r) for r in parsed[:_SUMMARY_HEAD_ROWS]]
+        + [_clip(r) for r in parsed[-_SUMMARY_TAIL_ROWS:]]
+    )
+
+    # Exact per-numeric-column aggregates, so totals survive even though
+    # most rows are elided from the prompt
+    stats = {}
+    for col in parsed[0].keys():
+        values = [r.get(col) for r in parsed]
+        if all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in values
+        ):
+            stats[col] = {
+                "min": min(values),
+                "max": max(values),
+                "sum": round(sum(values), 2),
+                "mean": round(statistics.fmean(values), 2),
             }
 
-    # =========================================================================
-    # SQL AGENT - Generates and executes queries
-    # =========================================================================
-    def sql_agent(state: MultiAgentState) -> dict:
-        """Generate and execute SQL query."""
-        user_question = state["user_question"]
-        messages = state.get("messages", [])
-        needs_viz = state.get("needs_viz", False)
-
-        # Build conversation context from recent messages (last 3 turns = 6 messages)
-        conversation_context = ""
-        recent_messages = messages[-7:-1] if len(messages) > 1 else []  # Exclude current question
-        if recent_messages:
-            context_parts = []
-            for msg in recent_messages:
-                role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-                # Truncate long responses to avoid prompt bloat
-                content = msg.content[:300] if len(msg.content) > 300 else msg.content
-                context_parts.append(f"{role}: {content}")
-            conversation_context = f"""
-=== CONVERSATION CONTEXT (CRITICAL - READ CAREFULLY) ===
-{chr(10).join(context_parts)}
+    parts = [
+        f"[{len(parsed)} rows total; showing first {_SUMMARY_HEAD_ROWS} and last {_SUMMARY_TAIL_ROWS}]",
+        _json_dumps(sample),
+    ]
+    if stats:
+        parts.append("Numeric column stats: " + _json_dumps(stats))
+    return " ".join(parts)
 
-CONTEXT CARRYOVER RULES:
-1. If user previously asked about a specific time period (e.g., "December 2025"), ALWAYS include that date filter in the new query
-2. If user says "these transactions", "those", "the same ones" - they mean the SAME data from the previous query
-3. When user adds a new filter (like "only spending account"), ADD it to existing filters, don't replace them
-4. Example: Previous query was for "December 2025", user now says "show only spending account" → keep BOTH the December 2025 AND spending account filters
-=== END CONTEXT ===
-"""
 
-        # Adjust prompt based on whether we need viz data
-        viz_hint = ""
-        if needs_viz:
-            chart_type = state.get("chart_type", "bar")
-            viz_hint = f"""
-IMPORTANT: The results will be used for a {chart_type} chart.
-- For bar/pie charts: Include a category column and a value column
-- For line charts: Include a date/time column and a value column
-- Keep the result set reasonable (max 10-15 rows for readability)
-- Use GROUP BY and ORDER BY appropriately
-"""
-        else:
-            # For raw list queries (no visualization), limit rows for UI safety
-            viz_hint = """
-ROW LIMIT: For queries that list individual transactions (not aggregates),
-use TOP 50 to limit results. This keeps the UI responsive.
-Example: SELECT TOP 50 * FROM Transactions WHERE ...
-"""
+def _sql_prompt_prefix(schema_info: str, sample_data_info: str) -> str:
+    """Build the static SQL-agent prompt prefix for a schema snapshot.
 
-        system_prompt = f"""You are a SQL expert for a finance database.
+    Keeping this byte-identical across turns lets Azure OpenAI's
+    automatic prompt caching skip prefill on the shared prefix; all
+    per-turn content (viz hints, conversation context) is appended
+    after it.
+    """
+    return f"""You are a SQL expert for a finance database.
 
-Database Schema:
+Database Schema (one line per table; '?' marks nullable columns):
 {schema_info}
 
 {sample_data_info}
 
 Generate a SQL query to answer the user's question.
 Return ONLY the SQL query, nothing else.
-{viz_hint}
+
 Rules:
 - Only SELECT queries allowed
 - Use proper SQL Server syntax
@@ -268,332 +519,802 @@ AccountID mapping (user terms to database values):
 Example: "What was my largest expense?" → SELECT MAX(SpendAmount) as largest_expense FROM Transactions WHERE SpendAmount > 0
 Example: "Show spending account transactions" → SELECT * FROM Transactions WHERE AccountID = 'spending'
 Example: "December 2025 transactions" → SELECT * FROM Transactions WHERE TransactionDate >= '2025-12-01' AND TransactionDate < '2026-01-01'
-{conversation_context}"""
+"""
 
-        try:
-            response = llm.invoke([
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=f"Generate SQL for: {user_question}"),
-            ])
-
-            sql_query = response.content.strip()
-            # Clean markdown
-            if sql_query.startswith("```sql"):
-                sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-            elif sql_query.startswith("```"):
-                sql_query = sql_query.replace("```", "").strip()
-
-            # Execute query
-            results = db.execute_sql_query(sql_query)
-
-            # Check for errors in results
+
+# Routing guidelines appended to the SQL rulebook for the combined
+# supervisor call: one LLM round trip yields both the routing decision
+# and the SQL query instead of paying for each separately
+_ROUTING_APPENDIX = """
+ROUTING: Alongside the SQL query, decide what the answer needs.
+- needs_sql: true for any data question (amounts, counts, lists, totals)
+- needs_viz: true ONLY for aggregated data with trends/comparisons/distributions
+- needs_viz: FALSE for listing individual transactions or showing raw data
+- chart_type:
+  - "bar" for category comparisons (by merchant, by type)
+  - "line" for time series (by month, by week, trends)
+  - "pie" for proportions (percentage breakdown)
+  - null if no visualization needed
+- sql_query: the SQL to run (null only when needs_sql is false). If
+  needs_viz is true, a best-effort query is fine - it will be regenerated
+  with chart-specific shaping.
+"""
+
+
+class CombinedDecision(BaseModel):
+    """Schema the supervisor LLM must fill: the routing decision plus the
+    SQL query, from a single structured-output call. Replaces hand-parsing
+    JSON (and fence-stripping) out of free-form completions."""
+
+    needs_sql: bool = True
+    needs_viz: bool = False
+    chart_type: Literal["bar", "line", "pie"] | None = None
+    sql_query: str | None = None
+    reasoning: str = ""
+
+
+# Rule-based routing fast path: for clearly-shaped questions the routing
+# decision is deterministic from keywords, so the supervisor can skip
+# its LLM round trip entirely (rules before cost-based search). Listing
+# wins over chart keywords, mirroring the prompt's "needs_viz: FALSE for
+# listing individual transactions" guideline.
+_ROUTE_LIST_RE = re.compile(
+    r"\b(list|show (?:me )?all|all transactions|transactions (?:from|in|for))\b",
+    re.IGNORECASE,
+)
+_ROUTE_LINE_RE = re.compile(
+    r"\b(over time|trend|monthly|weekly|by month|by week|per month)\b", re.IGNORECASE
+)
+_ROUTE_PIE_RE = re.compile(
+    r"\b(breakdown|percentage|proportion|share of)\b", re.IGNORECASE
+)
+_ROUTE_BAR_RE = re.compile(
+    r"\b(by (?:category|merchant|type|account)|compare|comparison)\b", re.IGNORECASE
+)
+# Small talk never needs SQL; anchored to the whole input so greetings
+# embedded in a real question ("thanks, now list December") don't match
+_ROUTE_SMALLTALK_RE = re.compile(
+    r"^\s*(hi|hello|hey|thanks|thank you|bye|goodbye|help|what can you do)[\s!.?]*$",
+    re.IGNORECASE,
+)
+
+
+def _fast_classify(question: str) -> dict | None:
+    """Classify a question by rule, or return None when unsure."""
+    if _ROUTE_SMALLTALK_RE.match(question):
+        return {"needs_sql": False, "needs_viz": False, "chart_type": None}
+    if _ROUTE_LIST_RE.search(question):
+        return {"needs_sql": True, "needs_viz": False, "chart_type": None}
+    if _ROUTE_LINE_RE.search(question):
+        return {"needs_sql": True, "needs_viz": True, "chart_type": "line"}
+    if _ROUTE_PIE_RE.search(question):
+        return {"needs_sql": True, "needs_viz": True, "chart_type": "pie"}
+    if _ROUTE_BAR_RE.search(question):
+        return {"needs_sql": True, "needs_viz": True, "chart_type": "bar"}
+    return None
+
+# Routing-decision cache, keyed on the normalized question. Only the
+# routing portion of a combined decision is cached — the generated SQL
+# depends on conversation context, so caching it would replay stale
+# queries. Repeats of the same question (common within a session) skip
+# the routing half of the supervisor's work.
+_routing_cache: dict[str, dict] = {}
+_ROUTING_CACHE_MAX = 512
+
+def _conversation_context(messages: list) -> str:
+    """Build the carryover context block from recent messages."""
+    recent_messages = messages[-7:-1] if len(messages) > 1 else []  # Exclude current question
+    if not recent_messages:
+        return ""
+    # Single comprehension; the [:300] slice truncates long responses
+    # to avoid prompt bloat and is a no-op for short ones
+    context_parts = [
+        "%s: %s" % (
+            "User" if isinstance(msg, HumanMessage) else "Assistant",
+            msg.content[:300],
+        )
+        for msg in recent_messages
+    ]
+    return (
+        "\n=== CONVERSATION CONTEXT (CRITICAL - READ CAREFULLY) ===\n"
+        + "\n".join(context_parts)
+        + """
+
+CONTEXT CARRYOVER RULES:
+1. If user previously asked about a specific time period (e.g., "December 2025"), ALWAYS include that date filter in the new query
+2. If user says "these transactions", "those", "the same ones" - they mean the SAME data from the previous query
+3. When user adds a new filter (like "only spending account"), ADD it to existing filters, don't replace them
+4. Example: Previous query was for "December 2025", user now says "show only spending account" → keep BOTH the December 2025 AND spending account filters
+=== END CONTEXT ===
+"""
+    )
+
+def _viz_hint(needs_viz: bool, chart_type: str | None) -> str:
+    """Build the viz/row-limit hint appended to the SQL prompt."""
+    if needs_viz:
+        return f"""
+IMPORTANT: The results will be used for a {chart_type or "bar"} chart.
+- For bar/pie charts: Include a category column and a value column
+- For line charts: Include a date/time column and a value column
+- Keep the result set reasonable (max 10-15 rows for readability)
+- Use GROUP BY and ORDER BY appropriately
+"""
+    # For raw list queries (no visualization), limit rows for UI safety
+    return """
+ROW LIMIT: For queries that list individual transactions (not aggregates),
+use TOP 50 to limit results. This keeps the UI responsive.
+Example: SELECT TOP 50 * FROM Transactions WHERE ...
+"""
+
+
+def _build_sql_messages(
+    user_question: str,
+    messages: list,
+    needs_viz: bool,
+    chart_type: str | None,
+    *,
+    sql_prompts: dict,
+) -> list:
+    """Assemble the SQL-generation message list.
+
+    The static rulebook travels in its own SystemMessage so its bytes
+    are identical on every turn — Azure OpenAI's automatic prefix cache
+    can then skip prefill on it. Per-turn conversation context rides in
+    a separate trailing system message instead of being concatenated in
+    front of or into the static block. Every static variant (no-viz plus
+    one per chart type) is specialized into a ready-made SystemMessage
+    at graph-build time, so no multi-KB prompt string is rebuilt here.
+    """
+    if needs_viz:
+        static_msg = sql_prompts.get(chart_type, sql_prompts["bar"])
+    else:
+        static_msg = sql_prompts[None]
+    msgs = [static_msg]
+    context = _conversation_context(messages)
+    if context:
+        msgs.append(SystemMessage(content=context))
+    msgs.append(HumanMessage(content=f"Generate SQL for: {user_question}"))
+    return msgs
+
+def _build_combined_messages(
+    user_question: str,
+    messages: list,
+    *,
+    combined_sys_msg: SystemMessage,
+) -> list:
+    """Assemble the combined routing + SQL-generation message list.
+
+    Same static/dynamic split as _build_sql_messages: the rulebook (plus
+    the routing appendix) is one byte-stable SystemMessage, conversation
+    context rides separately.
+    """
+    msgs = [combined_sys_msg]
+    context = _conversation_context(messages)
+    if context:
+        msgs.append(SystemMessage(content=context))
+    msgs.append(HumanMessage(content=f"User question: {user_question}"))
+    return msgs
+
+
+def _clean_sql(content: str) -> str:
+    """Strip markdown fences from a generated SQL string."""
+    fence = _FENCE_RE.search(content)
+    return fence.group(1).strip() if fence else content.strip()
+
+
+# =========================================================================
+# SUPERVISOR AGENT - Routes to other agents
+# =========================================================================
+async def supervisor(
+    state: MultiAgentState,
+    *,
+    combined_llm,
+    combined_sys_msg: SystemMessage,
+) -> dict:
+    """Analyze user question and decide which agents to invoke.
+
+    Routing and SQL generation are batched into a single structured-
+    output call: the prompt is the SQL rulebook plus a routing appendix,
+    and the model fills CombinedDecision (routing fields + sql_query) in
+    one round trip. Rule-classified and cache-hit questions skip the
+    call entirely and leave SQL generation to sql_agent; only the
+    routing fields of a combined decision are cached, since the SQL
+    depends on conversation context.
+    """
+    messages = state["messages"]
+    user_question = messages[-1].content if messages else ""
+    speculative_sql = None
+
+    try:
+        # Rule-based fast path first, then the routing cache; only
+        # ambiguous, unseen questions pay for an LLM call — and that one
+        # call also yields the SQL query
+        routing = _fast_classify(user_question)
+        if routing is None:
+            routing = _routing_cache.get(user_question.strip().lower())
+        if routing is None:
+            decision = await combined_llm.ainvoke(_build_combined_messages(
+                user_question, messages, combined_sys_msg=combined_sys_msg,
+            ))
+            routing = {
+                "needs_sql": decision.needs_sql,
+                "needs_viz": decision.needs_viz,
+                "chart_type": decision.chart_type,
+            }
+            if len(_routing_cache) < _ROUTING_CACHE_MAX:
+                _routing_cache[user_question.strip().lower()] = routing
+            # The combined SQL was generated with the no-viz rulebook;
+            # hand it to sql_agent only when that assumption holds
+            if decision.sql_query and decision.needs_sql and not decision.needs_viz:
+                speculative_sql = _clean_sql(decision.sql_query)
+
+        return {
+            "user_question": user_question,
+            "needs_sql": routing.get("needs_sql", True),
+            "needs_viz": routing.get("needs_viz", False),
+            "chart_type": routing.get("chart_type"),
+            "speculative_sql": speculative_sql,
+            "sql_query": None,
+            "sql_results": None,
+            "sql_results_parsed": None,
+            "chart_path": None,
+            "final_response": None,
+            "error": None,
+            # Reset artifact fields
+            "table_columns": None,
+            "table_rows": None,
+            "row_count": None,
+            "show_table": False,
+        }
+
+    except Exception as e:
+        # Default to SQL only when routing fails; keep the cause visible
+        print(f"Routing failed ({e}); defaulting to SQL-only", file=sys.stderr)
+        return {
+            "user_question": user_question,
+            "needs_sql": True,
+            "needs_viz": False,
+            "chart_type": None,
+            "speculative_sql": None,
+            "error": None,
+            # Reset artifact fields
+            "table_columns": None,
+            "table_rows": None,
+            "row_count": None,
+            "show_table": False,
+        }
+
+
+# =========================================================================
+# SQL AGENT - Generates and executes queries
+# =========================================================================
+async def sql_agent(
+    state: MultiAgentState,
+    *,
+    llm,
+    sql_prompts: dict,
+) -> dict:
+    """Generate and execute SQL query."""
+    user_question = state["user_question"]
+    messages = state.get("messages", [])
+    needs_viz = state.get("needs_viz", False)
+
+    try:
+        # Use the SQL carried over from the supervisor's combined call
+        # when available; it was built with the same no-viz rulebook
+        speculative_sql = state.get("speculative_sql")
+        if speculative_sql and not needs_viz:
+            sql_query = speculative_sql
+        else:
+            response = await llm.ainvoke(_build_sql_messages(
+                user_question, messages, needs_viz, state.get("chart_type"),
+                sql_prompts=sql_prompts,
+            ))
+            sql_query = _clean_sql(response.content)
+
+        # Execute query (through the TTL'd result cache) on a worker
+        # thread: pyodbc blocks, and parking it off the event loop keeps
+        # the loop free for concurrent turns (web UI) and callbacks
+        results = await asyncio.to_thread(_cached_execute, sql_query)
+
+        # Parse once here; viz_agent and response_agent reuse the
+        # object through state instead of re-parsing the JSON string.
+        # Oversized payloads (accidental huge SELECTs) are not parsed
+        # eagerly at all — results_json_to_table stream-parses them and
+        # keeps only the capped rows, and downstream consumers work from
+        # those table artifacts instead.
+        if len(results) > artifacts.STREAM_PARSE_THRESHOLD:
+            parsed = None
+        else:
             try:
-                results_json = json.loads(results)
-                if isinstance(results_json, dict) and "error" in results_json:
-                    return {
-                        "sql_query": sql_query,
-                        "sql_results": None,
-                        "error": f"SQL Error: {results_json['error']}",
-                    }
-            except json.JSONDecodeError:
-                pass
-
-            # Parse results into table artifact fields
-            table_result = artifacts.results_json_to_table(results)
-
-            if isinstance(table_result, dict) and table_result.get("type") == "error":
-                # SQL returned an error
-                return {
-                    "sql_query": sql_query,
-                    "sql_results": results,
-                    "error": table_result["message"],
-                    "table_columns": None,
-                    "table_rows": None,
-                    "row_count": None,
-                }
-
-            columns, rows, row_count = table_result
+                parsed = _json_loads(results)
+            except ValueError:
+                # Covers both json.JSONDecodeError and orjson.JSONDecodeError
+                parsed = None
+
+        if isinstance(parsed, dict) and "error" in parsed:
             return {
                 "sql_query": sql_query,
-                "sql_results": results,
-                "error": None,
-                "table_columns": columns,
-                "table_rows": rows,
-                "row_count": row_count,
+                "sql_results": None,
+                "sql_results_parsed": None,
+                "error": f"SQL Error: {parsed['error']}",
             }
 
-        except Exception as e:
+        # Build table artifact fields from the already-parsed rows
+        table_result = artifacts.results_json_to_table(
+            parsed if parsed is not None else results
+        )
+
+        if isinstance(table_result, dict) and table_result.get("type") == "error":
+            # SQL returned an error
             return {
-                "sql_query": None,
-                "sql_results": None,
-                "error": f"SQL Agent error: {str(e)}",
+                "sql_query": sql_query,
+                "sql_results": results,
+                "sql_results_parsed": None,
+                "error": table_result["message"],
                 "table_columns": None,
                 "table_rows": None,
                 "row_count": None,
             }
 
-    # =========================================================================
-    # VISUALIZATION AGENT - Creates charts
-    # =========================================================================
-    def _is_numeric(value) -> bool:
-        """Check if a value is numeric (int, float, or convertible)."""
-        if value is None:
-            return False
-        if isinstance(value, (int, float)):
-            return True
-        try:
-            float(value)
-            return True
-        except (ValueError, TypeError):
-            return False
-
-    def _is_date_like(value) -> bool:
-        """Check if a value looks like a date (ISO format string)."""
-        if value is None:
-            return False
-        if isinstance(value, str):
-            # Check for ISO date patterns: YYYY-MM-DD or YYYY-MM
-            if len(value) >= 7 and value[4] == '-':
-                return True
+        columns, rows, row_count = table_result
+        return {
+            "sql_query": sql_query,
+            "sql_results": results,
+            "sql_results_parsed": parsed if isinstance(parsed, list) else None,
+            "error": None,
+            "table_columns": columns,
+            "table_rows": rows,
+            "row_count": row_count,
+        }
+
+    except Exception as e:
+        return {
+            "sql_query": None,
+            "sql_results": None,
+            "sql_results_parsed": None,
+            "error": f"SQL Agent error: {str(e)}",
+            "table_columns": None,
+            "table_rows": None,
+            "row_count": None,
+        }
+
+
+# =========================================================================
+# VISUALIZATION AGENT - Creates charts
+# =========================================================================
+def _is_numeric(value) -> bool:
+    """Check if a value is numeric (int, float, or convertible)."""
+    if value is None:
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(value)
+        return True
+    except (ValueError, TypeError):
         return False
 
-    def _find_numeric_column(data: list, columns: list) -> str | None:
-        """Find the first column with numeric values."""
-        for col in columns:
-            # Sample first few rows to check if column is numeric
-            sample_values = [row.get(col) for row in data[:5] if row.get(col) is not None]
-            if sample_values and all(_is_numeric(v) for v in sample_values):
-                return col
-        return None
 
-    def _find_date_column(data: list, columns: list) -> str | None:
-        """Find the first column with date-like values."""
-        for col in columns:
-            sample_values = [row.get(col) for row in data[:5] if row.get(col) is not None]
-            if sample_values and all(_is_date_like(v) for v in sample_values):
-                return col
-        return None
+def _is_date_like(value) -> bool:
+    """Check if a value looks like a date (ISO format string)."""
+    if value is None:
+        return False
+    if isinstance(value, str):
+        # Check for ISO date patterns: YYYY-MM-DD or YYYY-MM
+        if len(value) >= 7 and value[4] == '-':
+            return True
+    return False
+
 
-    def viz_agent(state: MultiAgentState) -> dict:
-        """Create visualization from SQL results."""
-        sql_results = state.get("sql_results")
-        chart_type = state.get("chart_type", "bar")
-        user_question = state.get("user_question", "")
+def _sniff_columns(data: list, columns: list) -> tuple[str | None, str | None]:
+    """Find the first all-numeric and first all-date-like columns.
 
-        if not sql_results:
+    One pass over the 5-row sample instead of a loop per column per
+    predicate; both answers come out of the same sweep.
+    """
+    numeric_ok = dict.fromkeys(columns, True)
+    date_ok = dict.fromkeys(columns, True)
+    seen = dict.fromkeys(columns, False)
+    for row in data[:5]:
+        for col in columns:
+            value = row.get(col)
+            if value is None:
+                continue
+            seen[col] = True
+            if numeric_ok[col] and not _is_numeric(value):
+                numeric_ok[col] = False
+            if date_ok[col] and not _is_date_like(value):
+                date_ok[col] = False
+    numeric_col = next((c for c in columns if seen[c] and numeric_ok[c]), None)
+    date_col = next((c for c in columns if seen[c] and date_ok[c]), None)
+    return numeric_col, date_col
+
+
+# One figure per thread, reused for every chart: a fresh 10x6 Agg
+# figure per turn re-allocates multi-MB pixel buffers and renderer
+# state that clearing the axes avoids. The OO API (Figure +
+# FigureCanvasAgg) bypasses pyplot's global figure registry, so
+# concurrent chart requests from the web UI neither contend on it nor
+# pay the pyplot import. Created lazily so non-viz sessions never pay
+# the matplotlib import either.
+_viz_local = threading.local()
+
+
+def _get_viz_axes():
+    """Create this thread's figure on first chart request, then reuse it."""
+    fig = getattr(_viz_local, "fig", None)
+    if fig is None:
+        import matplotlib
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        # Collapse sub-pixel path segments at render time; harmless for
+        # the handful of bars/wedges, a real win for dense line charts
+        matplotlib.rcParams["path.simplify"] = True
+        matplotlib.rcParams["path.simplify_threshold"] = 1.0
+
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)  # Registers itself as fig.canvas
+        ax = fig.add_subplot(111)
+        # Fixed margins set once replace per-call tight_layout (a
+        # constraint solve) and bbox_inches="tight" (a second full
+        # render pass); the generous bottom fits rotated x labels
+        fig.subplots_adjust(left=0.1, right=0.95, top=0.9, bottom=0.25)
+        _viz_local.fig, _viz_local.ax = fig, ax
+    return _viz_local.fig, _viz_local.ax
+
+
+def viz_agent(state: MultiAgentState) -> dict:
+    """Create visualization from SQL results."""
+    data = state.get("sql_results_parsed")  # Parsed once by sql_agent
+    if not data and state.get("table_rows"):
+        # Oversized payloads are never fully parsed; the capped table
+        # rows (50) are more than a readable chart holds anyway
+        columns = state.get("table_columns") or []
+        data = [dict(zip(columns, row)) for row in state["table_rows"]]
+    chart_type = state.get("chart_type", "bar")
+    user_question = state.get("user_question", "")
+
+    if not data:
+        return {"chart_path": None, "error": "No data to visualize"}
+
+    try:
+        if not isinstance(data, list):
             return {"chart_path": None, "error": "No data to visualize"}
 
-        try:
-            data = json.loads(sql_results)
-            if not data or not isinstance(data, list):
-                return {"chart_path": None, "error": "No data to visualize"}
-
-            # Get column names from first row
-            columns = list(data[0].keys())
-
-            if len(columns) < 2:
-                return {
-                    "chart_path": None,
-                    "error": "Need at least 2 columns for visualization (category + value)."
-                }
-
-            # Smart column detection
-            # 1. Find numeric column for y-axis (required)
-            y_col = _find_numeric_column(data, columns)
-            if not y_col:
-                return {
-                    "chart_path": None,
-                    "error": "Cannot chart: no numeric column found. Try asking for aggregated data (counts, sums, averages) instead of listing raw transactions."
-                }
-
-            # 2. Find x-axis column
-            # For line charts, prefer date columns
-            if chart_type == "line":
-                date_col = _find_date_column(data, columns)
-                if date_col:
-                    x_col = date_col
-                else:
-                    # Use first non-numeric column, or first column
-                    x_col = next((c for c in columns if c != y_col), columns[0])
-            else:
-                # For bar/pie: use first column that's not the y column
-                x_col = next((c for c in columns if c != y_col), columns[0])
-
-            # Extract data
-            x_values = [str(row.get(x_col, ""))[:20] for row in data]  # Truncate long labels
-
-            # Convert y_values to float (we already verified they're numeric)
-            y_values = []
-            for row in data:
-                val = row.get(y_col, 0)
-                try:
-                    y_values.append(float(val) if val is not None else 0.0)
-                except (ValueError, TypeError):
-                    y_values.append(0.0)
-
-            # Create figure
-            fig, ax = plt.subplots(figsize=(10, 6))
-
-            if chart_type == "pie":
-                # Pie chart - use absolute values (can't show negatives)
-                y_abs = [abs(v) for v in y_values]
-                if sum(y_abs) == 0:
-                    return {"chart_path": None, "error": "No non-zero data to visualize"}
-                ax.pie(y_abs, labels=x_values, autopct="%1.1f%%", startangle=90)
-                ax.set_title(f"Distribution: {user_question[:50]}")
-            elif chart_type == "line":
-                # Line chart
-                ax.plot(x_values, y_values, marker="o", linewidth=2, markersize=8)
-                ax.set_xlabel(x_col)
-                ax.set_ylabel(y_col)
-                ax.set_title(f"Trend: {user_question[:50]}")
-                plt.xticks(rotation=45, ha="right")
-            else:
-                # Bar chart (default)
-                bars = ax.bar(x_values, y_values, color="steelblue")
-                ax.set_xlabel(x_col)
-                ax.set_ylabel(y_col)
-                ax.set_title(f"Comparison: {user_question[:50]}")
-                plt.xticks(rotation=45, ha="right")
-
-                # Add value labels on bars
-                for bar, val in zip(bars, y_values):
-                    height = bar.get_height()
-                    ax.text(
-                        bar.get_x() + bar.get_width() / 2.0,
-                        height,
-                        f"{val:,.0f}",
-                        ha="center",
-                        va="bottom",
-                        fontsize=9,
-                    )
+        # Get column names from first row
+        columns = list(data[0].keys())
 
-            plt.tight_layout()
+        if len(columns) < 2:
+            return {
+                "chart_path": None,
+                "error": "Need at least 2 columns for visualization (category + value)."
+            }
 
-            # Save to system temp directory with UUID (no collisions)
-            chart_path = artifacts.generate_unique_chart_path()
-            plt.savefig(chart_path, dpi=100, bbox_inches="tight")
-            plt.close(fig)
+        # Smart column detection: one sweep yields both candidates
+        # 1. Numeric column for y-axis (required)
+        y_col, date_col = _sniff_columns(data, columns)
+        if not y_col:
+            return {
+                "chart_path": None,
+                "error": "Cannot chart: no numeric column found. Try asking for aggregated data (counts, sums, averages) instead of listing raw transactions."
+            }
 
-            return {"chart_path": chart_path, "error": None}
+        # 2. Find x-axis column
+        # For line charts, prefer date columns
+        if chart_type == "line" and date_col:
+            x_col = date_col
+        else:
+            # For bar/pie (or no date column): first column that's not y
+            x_col = next((c for c in columns if c != y_col), columns[0])
+
+        # Extract both columns in one pass over the rows, then convert
+        # in bulk: the fixed-width unicode dtype truncates long labels
+        # to 20 chars in C
+        x_list = []
+        y_list = []
+        for row in data:
+            x_list.append(str(row.get(x_col, "")))
+            y_val = row.get(y_col)
+            y_list.append(float(y_val) if _is_numeric(y_val) else 0.0)
+        x_values = np.array(x_list, dtype="U20")
+        y_values = np.asarray(y_list, dtype=np.float64)
+
+        # Reuse the shared figure; clear previous draw state
+        fig, ax = _get_viz_axes()
+        ax.clear()
+
+        if chart_type == "pie":
+            # Pie chart - use absolute values (can't show negatives);
+            # vectorized on the array we already built
+            y_abs = np.abs(y_values)
+            if y_abs.sum() == 0:
+                return {"chart_path": None, "error": "No non-zero data to visualize"}
+            ax.pie(y_abs, labels=x_values, autopct="%1.1f%%", startangle=90)
+            ax.set_title(f"Distribution: {user_question[:50]}")
+        elif chart_type == "line":
+            # Line chart
+            ax.plot(x_values, y_values, marker="o", linewidth=2, markersize=8)
+            ax.set_xlabel(x_col)
+            ax.set_ylabel(y_col)
+            ax.set_title(f"Trend: {user_question[:50]}")
+            for label in ax.get_xticklabels():
+                label.set_rotation(45)
+                label.set_ha("right")
+        else:
+            # Bar chart (default); rasterize dense bar sets so the
+            # vector machinery doesn't track every patch individually
+            bars = ax.bar(
+                x_values, y_values, color="steelblue",
+                rasterized=len(data) > 30,
+            )
+            ax.set_xlabel(x_col)
+            ax.set_ylabel(y_col)
+            ax.set_title(f"Comparison: {user_question[:50]}")
+            for label in ax.get_xticklabels():
+                label.set_rotation(45)
+                label.set_ha("right")
+
+            # Add value labels on bars in one artist pass
+            ax.bar_label(
+                bars,
+                labels=[f"{val:,.0f}" for val in y_values],
+                fontsize=9,
+            )
 
-        except Exception as e:
-            return {"chart_path": None, "error": f"Visualization error: {str(e)}"}
+        # Render once into memory, then write the PNG in one call.
+        # Save to system temp directory with UUID (no collisions)
+        # 90 dpi is indistinguishable in the chat UI; empty metadata and
+        # the lightest zlib level skip work the viewer never notices
+        chart_path = artifacts.generate_unique_chart_path()
+        buf = io.BytesIO()
+        fig.savefig(
+            buf,
+            format="png",
+            dpi=90,
+            metadata={},
+            pil_kwargs={"optimize": False, "compress_level": 1},
+        )
+        with open(chart_path, "wb") as f:
+            f.write(buf.getbuffer())
+
+        return {"chart_path": chart_path, "error": None}
 
-    # =========================================================================
-    # RESPONSE AGENT - Synthesizes final response
-    # =========================================================================
-    def response_agent(state: MultiAgentState) -> dict:
-        """Synthesize final response from all agent outputs."""
-        user_question = state.get("user_question", "")
-        sql_query = state.get("sql_query")
-        sql_results = state.get("sql_results")
-        chart_path = state.get("chart_path")
-        error = state.get("error")
-        row_count = state.get("row_count", 0) or 0
-
-        # Progressive disclosure: determine if table should be shown
-        # Show table if:
-        # 1. User explicitly asks for data/table/list
-        # 2. Row count is small (<=10)
-        show_table = False
-        if row_count > 0:
-            # Check for explicit data request keywords
-            question_lower = user_question.lower()
-            explicit_data_keywords = ["show", "list", "display", "table", "data", "transactions"]
-            has_explicit_request = any(kw in question_lower for kw in explicit_data_keywords)
-
-            if has_explicit_request or row_count <= 10:
-                show_table = True
-
-        # Handle error case
-        if error:
-            system_prompt = f"""The user asked: "{user_question}"
+    except Exception as e:
+        return {"chart_path": None, "error": f"Visualization error: {str(e)}"}
+
+
+# =========================================================================
+# RESPONSE AGENT - Synthesizes final response
+# =========================================================================
+async def response_agent(state: MultiAgentState, *, llm) -> dict:
+    """Synthesize final response from all agent outputs."""
+    user_question = state.get("user_question", "")
+    sql_query = state.get("sql_query")
+    sql_results = state.get("sql_results")
+    # Runs concurrently with viz_agent, so chart_path isn't available
+    # yet; needs_viz says whether a chart is being drawn
+    needs_viz = state.get("needs_viz", False)
+    error = state.get("error")
+    row_count = state.get("row_count", 0) or 0
+
+    # Progressive disclosure: determine if table should be shown
+    # Show table if:
+    # 1. User explicitly asks for data/table/list
+    # 2. Row count is small (<=10)
+    show_table = False
+    if row_count > 0:
+        # Check for explicit data request keywords
+        question_lower = user_question.lower()
+        explicit_data_keywords = ["show", "list", "display", "table", "data", "transactions"]
+        has_explicit_request = any(kw in question_lower for kw in explicit_data_keywords)
+
+        if has_explicit_request or row_count <= 10:
+            show_table = True
+
+    # Handle error case
+    if error:
+        system_prompt = f"""The user asked: "{user_question}"
 An error occurred: {error}
 
 Explain the error briefly and suggest what might help."""
 
-            response = llm.invoke([
-                SystemMessage(content=system_prompt),
-                HumanMessage(content="Explain the error to the user."),
-            ])
-            return {
-                "final_response": response.content,
-                "messages": [AIMessage(content=response.content)],
-                "show_table": False,
-            }
+        response = await llm.ainvoke([
+            SystemMessage(content=system_prompt),
+            _EXPLAIN_ERROR_MSG,
+        ])
+        return {
+            "final_response": response.content,
+            "messages": [AIMessage(content=response.content)],
+            "show_table": False,
+        }
+
+    # Single-cell aggregate results (e.g. SELECT MAX(...)) don't need
+    # an LLM turn to phrase: format the number directly and save the
+    # round trip. Only amount-like columns get the CZK/decimal
+    # treatment — a COUNT(*) is not currency. Counts format as plain
+    # integers; anything else (non-numeric, multi-cell, ambiguous
+    # floats) falls through to the LLM.
+    if sql_results and not needs_viz:
+        data = state.get("sql_results_parsed")
+        if isinstance(data, list) and len(data) == 1 and len(data[0]) == 1:
+            key, value = next(iter(data[0].items()))
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                label = key.replace("_", " ").title()
+                if _AMOUNT_COL_RE.search(key):
+                    final_response = f"{label}: {value:,.2f} CZK"
+                elif isinstance(value, int):
+                    final_response = f"{label}: {value:,}"
+                else:
+                    final_response = None
+                if final_response is not None:
+                    return {
+                        "final_response": final_response,
+                        "messages": [AIMessage(content=final_response)],
+                        "show_table": False,
+                    }
 
-        # Build context for response
-        context_parts = [f'User asked: "{user_question}"']
+    # Build context for response
+    context_parts = [f'User asked: "{user_question}"']
+
+    if sql_query:
+        context_parts.append(f"SQL query executed: {sql_query}")
+
+    if sql_results:
+        parsed = state.get("sql_results_parsed")
+        if isinstance(parsed, list) and parsed:
+            context_parts.append(f"Query results: {_summarize_results_for_llm(parsed)}")
+        elif state.get("table_rows"):
+            # Oversized payloads: rebuild rows from the capped table
+            # artifacts instead of re-parsing the huge JSON string
+            columns = state.get("table_columns") or []
+            capped = [dict(zip(columns, row)) for row in state["table_rows"]]
+            context_parts.append(f"Query results: {_summarize_results_for_llm(capped)}")
+        else:
+            context_parts.append(f"Query results: {_results_for_context(sql_results)}")
 
-        if sql_query:
-            context_parts.append(f"SQL query executed: {sql_query}")
+    # Note: We no longer tell the LLM about chart paths - UI handles that
+    if needs_viz:
+        context_parts.append("A chart has been generated for this data.")
 
-        if sql_results:
-            context_parts.append(f"Query results: {sql_results}")
+    context = "\n".join(context_parts)
 
-        # Note: We no longer tell the LLM about chart paths - UI handles that
-        has_chart = bool(chart_path and chart_path.strip())
-        if has_chart:
-            context_parts.append("A chart has been generated for this data.")
+    system_prompt = _RESPONSE_PROMPT_HEADER + context + _RESPONSE_PROMPT_FOOTER
 
-        context = "\n".join(context_parts)
+    try:
+        # Stream the completion instead of blocking on the full
+        # response: the web UI's event stream surfaces tokens as they
+        # arrive (time-to-first-token instead of time-to-last-token),
+        # and the CLI still receives the accumulated text
+        chunks = []
+        async for chunk in llm.astream([
+            SystemMessage(content=system_prompt),
+            _RESPONSE_HUMAN_MSG,
+        ]):
+            chunks.append(chunk.content)
+
+        final_response = "".join(chunks)
+
+        # No longer append chart path - UI handles chart display
+        return {
+            "final_response": final_response,
+            "messages": [AIMessage(content=final_response)],
+            "show_table": show_table,
+        }
 
-        system_prompt = f"""You are a helpful finance assistant presenting results.
+    except Exception as e:
+        error_msg = f"Error generating response: {str(e)}"
+        return {
+            "final_response": error_msg,
+            "messages": [AIMessage(content=error_msg)],
+            "show_table": False,
+        }
+
+
+# =========================================================================
+# ROUTING FUNCTIONS
+# =========================================================================
+def route_after_supervisor(state: MultiAgentState) -> Literal["sql_agent", "response_agent"]:
+    """Route after supervisor - always go to SQL if needed."""
+    if state.get("needs_sql", True):
+        return "sql_agent"
+    return "response_agent"
+
+def route_after_sql(state: MultiAgentState) -> list[str]:
+    """Fan out after SQL - viz and response run in the same superstep.
+
+    Chart drawing and answer generation are independent (the response
+    never needs the chart bytes, only the fact that one is coming), so
+    on viz turns the wall time is max(viz, response) instead of their
+    sum. Each branch writes disjoint state keys and both converge on
+    END.
+    """
+    if not state.get("error") and state.get("needs_viz", False):
+        return ["viz_agent", "response_agent"]
+    return ["response_agent"]
 
-{context}
 
-Provide a clear, natural language summary of the results.
-- Be concise but informative
-- Highlight key numbers or insights
-- Format numbers nicely (use commas for thousands)
-- Always use 'CZK' as the currency when presenting monetary amounts (Czech Koruna), never '$'. Example: '4,604.81 CZK'
-- If a chart was generated, you can briefly mention it exists (e.g., "see the chart for visual breakdown")
-- Do NOT mention file paths or where charts are saved"""
+# Compiled graphs keyed by LLM identity plus schema/sample content
+# hashes: graph.compile() validates and assembles the whole state
+# machine, which is pure repeat work when the inputs haven't changed
+_GRAPH_CACHE: dict = {}
 
-        try:
-            response = llm.invoke([
-                SystemMessage(content=system_prompt),
-                HumanMessage(content="Summarize the results for the user."),
-            ])
 
-            final_response = response.content
+def _make_checkpointer():
+    """Optional on-disk session persistence for the compiled graph.
 
-            # No longer append chart path - UI handles chart display
-            return {
-                "final_response": final_response,
-                "messages": [AIMessage(content=final_response)],
-                "show_table": show_table,
-            }
+    Gated on FIN_CHATBOT_STATE_DB (path to a SQLite file) and on the
+    langgraph-checkpoint-sqlite package being installed. Returns None
+    otherwise, in which case the graph compiles without persistence and
+    behaves exactly as before.
 
-        except Exception as e:
-            error_msg = f"Error generating response: {str(e)}"
-            return {
-                "final_response": error_msg,
-                "messages": [AIMessage(content=error_msg)],
-                "show_table": False,
-            }
+    Uses the async saver: every invocation path here is async
+    (ainvoke/astream), and the sync SqliteSaver raises
+    NotImplementedError from those. The aiosqlite connection is opened
+    on the shared background loop — the same loop all graph coroutines
+    run on — so its futures always resolve on the loop that awaits them.
+    """
+    db_path = os.getenv("FIN_CHATBOT_STATE_DB")
+    if not db_path:
+        return None
+    try:
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        return None
 
-    # =========================================================================
-    # ROUTING FUNCTIONS
-    # =========================================================================
-    def route_after_supervisor(state: MultiAgentState) -> Literal["sql_agent", "response_agent"]:
-        """Route after supervisor - always go to SQL if needed."""
-        if state.get("needs_sql", True):
-            return "sql_agent"
-        return "response_agent"
-
-    def route_after_sql(state: MultiAgentState) -> Literal["viz_agent", "response_agent"]:
-        """Route after SQL - go to viz if needed and no error."""
-        if state.get("error"):
-            return "response_agent"
-        if state.get("needs_viz", False):
-            return "viz_agent"
-        return "response_agent"
-
-    def route_after_viz(_state: MultiAgentState) -> Literal["response_agent"]:
-        """Always go to response after viz."""
-        return "response_agent"
+    async def _open():
+        return await aiosqlite.connect(db_path)
+
+    return AsyncSqliteSaver(_run_async(_open()))
+
+
+def create_multi_agent_system(
+    llm: AzureChatOpenAI,
+    schema_info: str,
+    sample_data_info: str,
+    use_checkpointer: bool = True,
+):
+    """Create a multi-agent system with Supervisor, SQL, Viz, and Response agents.
+
+    Architecture:
+    - Supervisor: Analyzes user intent, decides which agents to invoke
+    - SQL Agent: Generates and executes SQL queries
+    - Viz Agent: Creates visualizations with matplotlib
+    - Response Agent: Synthesizes final response
+
+    Node functions live at module scope; this builder only binds them to
+    the LLM and the precomputed prompt strings with functools.partial and
+    wires the graph. Compiled systems are memoized per (llm, schema,
+    sample data) so repeated calls with the same inputs return the same
+    graph. (A dict keyed on id(llm) rather than lru_cache: the pydantic
+    LLM object is not hashable.)
+
+    use_checkpointer=False skips the optional FIN_CHATBOT_STATE_DB
+    persistence even when configured — for callers (the web UI) that
+    manage their own history and pass no thread_id.
+    """
+    cache_key = (
+        id(llm),
+        hashlib.blake2b(schema_info.encode(), digest_size=8).digest(),
+        hashlib.blake2b(sample_data_info.encode(), digest_size=8).digest(),
+        use_checkpointer,
+    )
+    cached = _GRAPH_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    sql_prompt_prefix = _sql_prompt_prefix(schema_info, sample_data_info)
+    # Specialize every static prompt variant here, once, down to the
+    # immutable SystemMessage objects: the no-viz prompt (keyed None)
+    # plus one per chart type. Per-turn prompt assembly is then just a
+    # dict lookup — no multi-KB f-string re-runs in the hot loop.
+    sql_prompts = {None: SystemMessage(content=sql_prompt_prefix + _viz_hint(False, None))}
+    for chart in ("bar", "line", "pie"):
+        sql_prompts[chart] = SystemMessage(
+            content=sql_prompt_prefix + _viz_hint(True, chart)
+        )
 
     # =========================================================================
     # BUILD THE GRAPH
@@ -601,10 +1322,21 @@ Provide a clear, natural language summary of the results.
     graph = StateGraph(MultiAgentState)
 
     # Add agent nodes
-    graph.add_node("supervisor", supervisor)
-    graph.add_node("sql_agent", sql_agent)
+    # Structured-output wrapper built once; the supervisor fills the
+    # CombinedDecision schema (routing + SQL) in a single call
+    combined_llm = llm.with_structured_output(CombinedDecision)
+    combined_sys_msg = SystemMessage(
+        content=sql_prompts[None].content + _ROUTING_APPENDIX
+    )
+    graph.add_node(
+        "supervisor",
+        functools.partial(
+            supervisor, combined_llm=combined_llm, combined_sys_msg=combined_sys_msg
+        ),
+    )
+    graph.add_node("sql_agent", functools.partial(sql_agent, llm=llm, sql_prompts=sql_prompts))
     graph.add_node("viz_agent", viz_agent)
-    graph.add_node("response_agent", response_agent)
+    graph.add_node("response_agent", functools.partial(response_agent, llm=llm))
 
     # Add edges
     graph.add_edge(START, "supervisor")
@@ -616,16 +1348,152 @@ Provide a clear, natural language summary of the results.
     graph.add_conditional_edges(
         "sql_agent",
         route_after_sql,
-        {"viz_agent": "viz_agent", "response_agent": "response_agent"},
-    )
-    graph.add_conditional_edges(
-        "viz_agent",
-        route_after_viz,
-        {"response_agent": "response_agent"},
+        ["viz_agent", "response_agent"],
     )
+    graph.add_edge("viz_agent", END)
     graph.add_edge("response_agent", END)
 
-    return graph.compile()
+    compiled = graph.compile(
+        checkpointer=_make_checkpointer() if use_checkpointer else None
+    )
+    _GRAPH_CACHE[cache_key] = compiled
+    return compiled
+
+
+@functools.cache
+def _get_llm() -> AzureChatOpenAI:
+    """Shared AzureChatOpenAI client behind a cached factory.
+
+    Env is read once and the client (with its pooled HTTP transports) is
+    reused for the life of the process, so a long-lived worker embedding
+    this module doesn't reconstruct it per turn — which also keeps the
+    graph cache keyed on id(llm) stable across calls.
+    """
+    return AzureChatOpenAI(
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT"],
+        api_version="2024-02-01",
+        api_key=os.environ["AZURE_OPENAI_API_KEY"],
+        temperature=0,
+        http_client=_http_client(),
+        http_async_client=_http_async_client(),
+    )
+
+
+@functools.cache
+def _get_langfuse(session_id: str) -> CallbackHandler:
+    """Shared Langfuse callback handler, one per session id."""
+    return CallbackHandler(
+        public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
+        secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
+        host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com"),
+        session_id=session_id,
+        user_id="cli-user",
+    )
+
+
+# Lazily built agent graph shared by answer_question() callers, so the
+# evaluation runner pays LLM-client and schema init once per process
+_runtime = None
+
+
+def _get_runtime():
+    """Build the LLM and agent graph on first use and reuse them after."""
+    global _runtime
+    if _runtime is None:
+        try:
+            schema_info, sample_data_info, _ = db.load_schema_context(sample_limit=2)
+        except Exception:
+            schema_info = "Schema information unavailable"
+            sample_data_info = ""
+
+        _runtime = create_multi_agent_system(_get_llm(), schema_info, sample_data_info)
+    return _runtime
+
+
+def _format_audit_block(user_input: str, result: dict) -> str:
+    """Format the --verbose audit block for a finished graph invocation."""
+    lines = [
+        "--- AUDIT START ---",
+        f"QUESTION: {user_input}",
+        f"SQL_GENERATED: {result.get('sql_query', 'N/A')}",
+    ]
+
+    # Parse and display SQL results
+    sql_results_raw = result.get("sql_results", "[]")
+    try:
+        result_data = _json_loads(sql_results_raw) if sql_results_raw else []
+        if isinstance(result_data, list):
+            lines.append(f"RESULT_COUNT: {len(result_data)}")
+        else:
+            lines.append("RESULT_COUNT: 1")
+        # Truncate for readability but keep parseable
+        truncated = sql_results_raw[:500] if len(sql_results_raw) > 500 else sql_results_raw
+        lines.append(f"SQL_RESULT: {truncated}")
+    except ValueError:
+        lines.append(f"SQL_RESULT: {sql_results_raw}")
+
+    lines.append(f"FINAL_ANSWER: {result.get('final_response', 'N/A')}")
+    if result.get("error"):
+        lines.append(f"ERROR: {result.get('error')}")
+    lines.append("--- AUDIT END ---")
+    return "\n".join(lines)
+
+
+def answer_question(question: str, verbose: bool = False) -> str:
+    """
+    Answer a single question in-process and return the CLI-format output.
+
+    Exposed for eval/run_evaluation.py so the smoke suite amortizes
+    interpreter, import, and LLM-client startup across the whole run
+    instead of paying it once per subprocess.
+
+    Args:
+        question: Natural-language question to answer
+        verbose: Include the audit block, matching `main.py --verbose`
+
+    Returns:
+        Output string in the same format the CLI prints
+    """
+    agent_system = _get_runtime()
+
+    emb, cached = _semantic_cache_lookup(question)
+    if cached is not None:
+        result = cached
+    else:
+        result = _run_async(agent_system.ainvoke({
+            "messages": [HumanMessage(content=question)],
+            "user_question": "",
+            "needs_sql": False,
+            "needs_viz": False,
+            "speculative_sql": None,
+            "sql_query": None,
+            "sql_results": None,
+            "sql_results_parsed": None,
+            "chart_type": None,
+            "chart_path": None,
+            "final_response": None,
+            "error": None,
+            # Artifact fields
+            "table_columns": None,
+            "table_rows": None,
+            "row_count": None,
+            "show_table": False,
+        # Fresh thread per call: eval questions are independent, and a
+        # thread_id is required whenever the checkpointer is enabled
+        }, config={"configurable": {"thread_id": f"eval-{uuid.uuid4().hex[:8]}"}}))
+        _semantic_cache_store(emb, result)
+
+    final_response = result.get("final_response", "")
+    parts = [
+        f"Assistant: {final_response}" if final_response
+        else "Assistant: [No response generated]"
+    ]
+
+    if verbose and (result.get("sql_query") or result.get("sql_results")):
+        parts.append(_format_audit_block(question, result))
+
+    return "\n".join(parts)
 
 
 def parse_args():
@@ -646,13 +1514,149 @@ Examples:
         action="store_true",
         help="Enable audit mode: show generated SQL and results in parseable format",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the SQL result cache (always hit the database)",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Start with a clean conversation instead of resuming the last session",
+    )
     return parser.parse_args()
 
 
+# Chat-loop control commands, matched against the casefolded input once
+# per turn; a frozenset keeps adding commands O(1)
+_EXIT_CMDS = frozenset({"quit", "exit"})
+
+
+# Cross-session CLI history sidecar: the previous conversation is
+# reloaded on startup (unless --fresh), so context carryover - and the
+# byte-stable prompt prefix built from it - survives a restart
+_HISTORY_DIR = os.path.expanduser("~/.fin_chatbot")
+_HISTORY_PATH = os.path.join(_HISTORY_DIR, "history.jsonl")
+_HISTORY_MAXLEN = 20
+
+
+def _load_history() -> deque:
+    """Rebuild the message deque from the history sidecar, if present."""
+    messages: deque[BaseMessage] = deque(maxlen=_HISTORY_MAXLEN)
+    try:
+        with open(_HISTORY_PATH, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = _json_loads(line)
+                except ValueError:
+                    continue
+                cls = HumanMessage if entry.get("role") == "user" else AIMessage
+                messages.append(cls(
+                    content=entry.get("content", ""),
+                    id=entry.get("id") or uuid.uuid4().hex,
+                ))
+    except OSError:
+        pass
+    return messages
+
+
+def _save_history(messages: deque) -> None:
+    """Write the message deque back to the sidecar (best-effort)."""
+    try:
+        os.makedirs(_HISTORY_DIR, exist_ok=True)
+        tmp = f"{_HISTORY_PATH}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for msg in messages:
+                role = "user" if isinstance(msg, HumanMessage) else "assistant"
+                f.write(json.dumps(
+                    {"role": role, "content": msg.content, "id": msg.id}
+                ) + "\n")
+        os.replace(tmp, _HISTORY_PATH)
+    except OSError:
+        pass
+
+
+def _keepalive_loop() -> None:
+    """Ping the LLM endpoint periodically while the CLI waits at input().
+
+    Idle keep-alive connections expire after 300s (see _http_client), so
+    a long think-time gap makes the next turn re-pay the TCP+TLS
+    handshake. A cheap HEAD request every 60s keeps the warm connection
+    open. Best-effort: any failure is ignored and the next real call
+    simply reconnects. Opt-in via FIN_CHATBOT_KEEPALIVE=1.
+    """
+    endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+    if not endpoint:
+        return
+    client = _http_client()
+    while True:
+        time.sleep(60)
+        try:
+            client.head(endpoint, timeout=5.0)
+        except Exception:
+            pass
+
+
+def _warm_llm_connection() -> None:
+    """One-shot warm-up of the LLM endpoint connection.
+
+    Opens the TCP+TLS connection while the user reads the startup
+    banner, so the first real turn doesn't pay the 300-800ms handshake
+    on top of the model latency. Runs on a daemon thread; best-effort,
+    any failure just means the first call connects as before.
+    """
+    endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+    if not endpoint:
+        return
+    try:
+        _http_client().head(endpoint, timeout=5.0)
+    except Exception:
+        pass
+
+
+async def _stream_turn(agent_system, payload: dict, config: dict) -> tuple[dict, bool]:
+    """Run one graph turn, printing response tokens as they arrive.
+
+    The "messages" stream surfaces completion tokens from the response
+    agent the moment the model emits them (time-to-first-token instead
+    of time-to-last-token at the terminal); the "values" stream carries
+    state snapshots, the last of which is the same dict ainvoke() would
+    return. Shortcut turns that skip the response LLM print nothing
+    here, so the caller falls back to printing final_response.
+
+    Returns:
+        Tuple of (final graph state, whether any tokens were printed)
+    """
+    result: dict = {}
+    printed = False
+    async for mode, data in agent_system.astream(
+        payload, config=config, stream_mode=["messages", "values"]
+    ):
+        if mode == "values":
+            result = data
+            continue
+        chunk, metadata = data
+        content = getattr(chunk, "content", "")
+        if content and metadata.get("langgraph_node") == "response_agent":
+            if not printed:
+                sys.stdout.write("\nAssistant: ")
+                printed = True
+            sys.stdout.write(content)
+            sys.stdout.flush()
+    if printed:
+        sys.stdout.write("\n\n")
+        sys.stdout.flush()
+    return result, printed
+
+
 def main():
     # Parse command line arguments
     args = parse_args()
 
+    if args.no_cache:
+        global _sql_cache_enabled
+        _sql_cache_enabled = False
+
     print("=" * 60)
     print("fin_chatbot - Multi-Agent System (CLI)")
     if args.verbose:
@@ -662,6 +1666,7 @@ def main():
     print("Ask questions about your transactions!")
     print('Try: "Show my expenses by category" for a chart')
     print("Type 'quit' or 'exit' to end the conversation")
+    print("Type '/clearcache' to drop cached answers and SQL results")
     print("For web interface: uv run python app.py")
     print("=" * 60)
     print()
@@ -669,48 +1674,53 @@ def main():
     # Get database schema for LLM context
     print("Loading database schema and sample data...")
     try:
-        schema_info = db.get_table_schema()
+        # Shared bootstrap: warms the pool and overlaps the schema,
+        # table-name, and batched sample fetches (see db.load_schema_context)
+        schema_info, sample_data_info, table_count = db.load_schema_context(
+            sample_limit=2
+        )
         print("✓ Schema loaded")
-
-        # Get sample data to enrich context
-        table_names = db.get_table_names()
-        sample_data_parts = []
-        for table_name in table_names:
-            sample_data = db.get_sample_data(table_name, limit=2)
-            sample_data_parts.append(sample_data)
-
-        sample_data_info = "\n".join(sample_data_parts)
-        print(f"✓ Sample data loaded from {len(table_names)} table(s)\n")
+        print(f"✓ Sample data loaded from {table_count} table(s)\n")
 
     except Exception as e:
         print(f"Warning: Could not load schema/sample data: {e}\n")
         schema_info = "Schema information unavailable"
         sample_data_info = ""
 
-    # Initialize Azure OpenAI with LangChain
-    llm = AzureChatOpenAI(
-        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
-        azure_deployment=os.environ["AZURE_OPENAI_DEPLOYMENT"],
-        api_version="2024-02-01",
-        api_key=os.environ["AZURE_OPENAI_API_KEY"],
-        temperature=0,
-    )
+    # Initialize Azure OpenAI with LangChain (cached factory, shared
+    # pooled HTTP client)
+    llm = _get_llm()
 
     # Create the multi-agent system
     agent_system = create_multi_agent_system(llm, schema_info, sample_data_info)
 
+    # When the optional checkpointer is on, langgraph owns the thread
+    # history: the first turn seeds the thread with the sidecar-loaded
+    # history, and every later turn sends only the new user message.
+    # Re-sending the local list each turn would add one duplicate
+    # assistant message per turn to checkpointed state, because the
+    # graph persists its own AIMessage (own id) and the CLI's local
+    # copy carries a different id — add_messages keeps both.
+    thread_owns_history = getattr(agent_system, "checkpointer", None) is not None
+    thread_seeded = False
+
+    # Warm the endpoint connection in the background so the first turn
+    # starts on a hot socket
+    threading.Thread(target=_warm_llm_connection, daemon=True).start()
+
+    # Optional connection keepalive while the user thinks (opt-in)
+    if os.getenv("FIN_CHATBOT_KEEPALIVE") == "1":
+        threading.Thread(target=_keepalive_loop, daemon=True).start()
+
+    # One id per CLI session: Langfuse groups traces by it, and the
+    # optional checkpointer uses it as the conversation thread_id
+    session_id = f"cli-session-{uuid.uuid4().hex[:8]}"
+
     # Initialize Langfuse callback for observability (optional)
     langfuse_handler = None
     if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
         try:
-            session_id = f"cli-session-{uuid.uuid4().hex[:8]}"
-            langfuse_handler = CallbackHandler(
-                public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-                secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-                host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com"),
-                session_id=session_id,
-                user_id="cli-user",
-            )
+            langfuse_handler = _get_langfuse(session_id)
             print(f"✓ Langfuse tracing enabled (session: {session_id})\n")
         except Exception as e:
             print(f"⚠ Langfuse initialization failed: {e}\n")
@@ -742,15 +1752,27 @@ def main():
     print("-" * 40)
     print()
 
-    # Interactive chat loop
-    messages: list[BaseMessage] = []
+    # Interactive chat loop. A bounded deque caps history growth (and
+    # prompt size) in long sessions; appends replace the full-list copy
+    # the add_messages reducer made redundant anyway. 20 messages is
+    # ample: context assembly only ever looks at the last 7. The deque
+    # is seeded from the history sidecar (unless --fresh) and written
+    # back on exit, so follow-up questions work across restarts.
+    messages: deque[BaseMessage] = deque(maxlen=_HISTORY_MAXLEN)
+    if not args.fresh:
+        messages = _load_history()
+        if messages:
+            print(f"(resumed {len(messages)} messages from the last session;"
+                  " use --fresh to start clean)\n")
+    atexit.register(_save_history, messages)
     try:
         while True:
             # Get user input
             user_input = input("You: ").strip()
 
             # Check for exit commands
-            if user_input.lower() in ["quit", "exit"]:
+            cmd = user_input.casefold()
+            if cmd in _EXIT_CMDS:
                 print("\nGoodbye!")
                 break
 
@@ -758,67 +1780,93 @@ def main():
             if not user_input:
                 continue
 
-            # Add user message
-            messages.append(HumanMessage(content=user_input))
+            # Cache control command
+            if cmd == "/clearcache":
+                _RESPONSE_CACHE.clear()
+                _sql_cache.clear()
+                _semantic_cache.clear()
+                print("\nCaches cleared.\n")
+                continue
+
+            # Key the response cache on the pre-question context
+            cache_key = (
+                _response_cache_key(user_input, messages)
+                if _sql_cache_enabled else None
+            )
+
+            # Add user message. Explicit ids keep the sidecar-reloaded
+            # history stable across runs (and make the one-time thread
+            # seeding below idempotent if a turn is retried)
+            messages.append(HumanMessage(content=user_input, id=uuid.uuid4().hex))
 
             # Execute multi-agent system
             try:
-                # Build config with optional Langfuse callback
-                config = {}
+                # Build config: conversation thread for the (optional)
+                # checkpointer, plus the Langfuse callback when enabled
+                config = {"configurable": {"thread_id": session_id}}
                 if langfuse_handler:
                     config["callbacks"] = [langfuse_handler]
 
-                result = agent_system.invoke({
-                    "messages": messages,
-                    "user_question": "",
-                    "needs_sql": False,
-                    "needs_viz": False,
-                    "sql_query": None,
-                    "sql_results": None,
-                    "chart_type": None,
-                    "chart_path": None,
-                    "final_response": None,
-                    "error": None,
-                    # Artifact fields
-                    "table_columns": None,
-                    "table_rows": None,
-                    "row_count": None,
-                    "show_table": False,
-                }, config=config if config else None)
+                streamed = False
+                result = _RESPONSE_CACHE.get(cache_key) if cache_key else None
+                if result is not None:
+                    _RESPONSE_CACHE.move_to_end(cache_key)
+                else:
+                    emb, result = _semantic_cache_lookup(user_input)
+                if result is None:
+                    # Checkpointed thread: send only the new message
+                    # after seeding; the graph already holds the rest
+                    if thread_owns_history and thread_seeded:
+                        payload_messages = [messages[-1]]
+                    else:
+                        payload_messages = list(messages)
+                    result, streamed = _run_async(_stream_turn(agent_system, {
+                        "messages": payload_messages,
+                        "user_question": "",
+                        "needs_sql": False,
+                        "needs_viz": False,
+                        "speculative_sql": None,
+                        "sql_query": None,
+                        "sql_results": None,
+                        "sql_results_parsed": None,
+                        "chart_type": None,
+                        "chart_path": None,
+                        "final_response": None,
+                        "error": None,
+                        # Artifact fields
+                        "table_columns": None,
+                        "table_rows": None,
+                        "row_count": None,
+                        "show_table": False,
+                    }, config))
+                    thread_seeded = True
+                    _semantic_cache_store(emb, result)
+
+                # Populate the exact-match cache (successful turns only)
+                if cache_key and not result.get("error"):
+                    _RESPONSE_CACHE[cache_key] = result
+                    while len(_RESPONSE_CACHE) > _RESPONSE_CACHE_MAX:
+                        _RESPONSE_CACHE.popitem(last=False)
 
                 # Get final response
                 final_response = result.get("final_response", "")
 
-                if final_response:
+                if streamed:
+                    # Tokens were already printed as they arrived
+                    messages.append(
+                        AIMessage(content=final_response, id=uuid.uuid4().hex)
+                    )
+                elif final_response:
                     print(f"\nAssistant: {final_response}\n")
-                    messages = list(result.get("messages", messages))
+                    messages.append(
+                        AIMessage(content=final_response, id=uuid.uuid4().hex)
+                    )
                 else:
                     print("\nAssistant: [No response generated]\n")
 
                 # Audit output (verbose mode) - structured for agent parsing
                 if args.verbose and (result.get("sql_query") or result.get("sql_results")):
-                    print("--- AUDIT START ---")
-                    print(f"QUESTION: {user_input}")
-                    print(f"SQL_GENERATED: {result.get('sql_query', 'N/A')}")
-
-                    # Parse and display SQL results
-                    sql_results_raw = result.get("sql_results", "[]")
-                    try:
-                        result_data = json.loads(sql_results_raw) if sql_results_raw else []
-                        if isinstance(result_data, list):
-                            print(f"RESULT_COUNT: {len(result_data)}")
-                        else:
-                            print("RESULT_COUNT: 1")
-                        # Truncate for readability but keep parseable
-                        truncated = sql_results_raw[:500] if len(sql_results_raw) > 500 else sql_results_raw
-                        print(f"SQL_RESULT: {truncated}")
-                    except json.JSONDecodeError:
-                        print(f"SQL_RESULT: {sql_results_raw}")
-
-                    print(f"FINAL_ANSWER: {result.get('final_response', 'N/A')}")
-                    if result.get("error"):
-                        print(f"ERROR: {result.get('error')}")
-                    print("--- AUDIT END ---")
+                    print(_format_audit_block(user_input, result))
                     print()
 
                 # Standard debug info (non-verbose mode)